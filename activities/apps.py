@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class ActivitiesConfig(AppConfig):
+    name = 'activities'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,110 @@
+'''
+ETag / Last-Modified functions for django.views.decorators.http.condition.
+They share one aggregate query per request, run before the view renders anything,
+so an unchanged page costs a 304 and no template rendering.
+'''
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.translation import get_language
+
+from .models import Activity, Collection, released_as_of, released_q
+
+
+def _etag(*items):
+    return hashlib.sha1('|'.join(str(item) for item in items).encode('utf-8')).hexdigest()
+
+
+def _memo(request, key, func):
+    'condition() calls both the etag and the last_modified function: query once'
+    memo = request.__dict__.setdefault('_conditional_state', {})
+    if key not in memo:
+        memo[key] = func()
+    return memo[key]
+
+
+def _viewer(request):
+    # editors see unreleased content and edit links
+    return 'editor' if request.user.is_authenticated else 'public'
+
+
+def _activity_state(request, code):
+    code = '%04d' % code if isinstance(code, int) else code
+    return _memo(request, ('activity', code), lambda: Activity.objects.filter(code=code).aggregate(
+        pk=Max('pk'),
+        released=Count('pk', filter=released_q(current=released_as_of(Activity)), distinct=True),
+        modified=Max('modification_date'),
+        # refreshed when metadata options, authors or attachments change (see ActivitySummary)
+        summary_modified=Max('summaries__modification_date'),
+        attachments=Count('attachment', distinct=True),
+        last_attachment=Max('attachment__pk'),
+        language_attachments=Count('languageattachment', distinct=True),
+        last_language_attachment=Max('languageattachment__pk'),
+    ))
+
+
+def activity_etag(request, code, *args, **kwargs):
+    if 'format' in request.GET:
+        # downloads answer with redirects and 202s, which must not be revalidated
+        return None
+    state = _activity_state(request, code)
+    if state['pk'] is None:
+        return None
+    return _etag(state['modified'], state['summary_modified'], get_language(), state['released'], _viewer(request),
+                 state['attachments'], state['last_attachment'], state['language_attachments'], state['last_language_attachment'])
+
+
+def activity_last_modified(request, code, *args, **kwargs):
+    if 'format' in request.GET:
+        return None
+    state = _activity_state(request, code)
+    return max([date for date in (state['modified'], state['summary_modified']) if date is not None], default=None)
+
+
+def _collection_state(request, collection_slug):
+    return _memo(request, ('collection', collection_slug), lambda: Collection.objects.filter(translations__slug=collection_slug).aggregate(
+        pk=Max('pk'),
+        released=Count('pk', filter=released_q(current=released_as_of(Collection)), distinct=True),
+        modified=Max('modification_date'),
+        activities=Count('activities', distinct=True),
+        released_activities=Count('activities', filter=released_q('activities__', released_as_of(Activity)), distinct=True),
+        activities_modified=Max('activities__modification_date'),
+        summaries_modified=Max('activities__summaries__modification_date'),
+    ))
+
+
+def collection_etag(request, collection_slug, *args, **kwargs):
+    state = _collection_state(request, collection_slug)
+    if state['pk'] is None:
+        return None
+    # the page lists the released activities of the collection
+    return _etag(state['modified'], get_language(), state['released'], _viewer(request), state['activities'], state['activities_modified'],
+                 state['summaries_modified'], state['released_activities'])
+
+
+def collection_last_modified(request, collection_slug, *args, **kwargs):
+    state = _collection_state(request, collection_slug)
+    dates = (state['modified'], state['activities_modified'], state['summaries_modified'])
+    return max([date for date in dates if date is not None], default=None)
+
+
+def _released_state(request, models):
+    'Number and latest modification of the released objects of each model'
+    return _memo(request, ('released',) + tuple(models), lambda: [
+        model.objects.available().aggregate(count=Count('pk'), modified=Max('modification_date')) for model in models
+    ])
+
+
+def released_etag(*models):
+    'ETag function for pages listing the released objects of models (feed, sitemap)'
+    def etag(request, *args, **kwargs):
+        states = _released_state(request, models)
+        return _etag(get_language(), request.GET.urlencode(), *[(state['count'], state['modified']) for state in states])
+    return etag
+
+
+def released_last_modified(*models):
+    def last_modified(request, *args, **kwargs):
+        states = _released_state(request, models)
+        return max([state['modified'] for state in states if state['modified'] is not None], default=None)
+    return last_modified
@@ -0,0 +1,32 @@
+'''
+Migration operations for Postgres-only features (text search, GIN indexes, extensions).
+They keep the migration state identical everywhere but only touch the database on Postgres,
+so the sqlite database used by default for development and tests still migrates.
+'''
+from django.db import migrations
+
+
+def is_postgres(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+class PostgresAddIndex(migrations.AddIndex):
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class PostgresRunSQL(migrations.RunSQL):
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
@@ -0,0 +1,36 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = 'activity-facets:generation'
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = 1
+        cache.add(GENERATION_KEY, generation, None)
+    return generation
+
+
+def cached_facet_counts(qs, filters):
+    '''
+    ActivityQuerySet.facet_counts() of qs, cached under the filter combination that produced it.
+    `filters` must identify qs completely (language, user access, category, selected options...).
+    '''
+    digest = hashlib.sha1(repr(sorted(filters.items())).encode('utf-8')).hexdigest()
+    key = 'activity-facets:%s:%s' % (_generation(), digest)
+    counts = cache.get(key)
+    if counts is None:
+        counts = qs.facet_counts()
+        cache.set(key, counts, settings.FACET_CACHE_TIMEOUT)
+    return counts
+
+
+def invalidate_facet_counts():
+    'Forget all the cached counts at once, by moving to a new generation of keys'
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
@@ -1,13 +1,13 @@
 import sys
-import tempfile
-import base64
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+from django.db import connections
 from django.db.models import Q
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.core.files.base import ContentFile
 
 from activities.models import Activity, ActivityTranslation
+from activities.tasks import init_worker, write_pdf
 
 
 class Command(BaseCommand):
@@ -15,11 +15,12 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         # Positional arguments
-        parser.add_argument('--code', help='Four digit code (YYnn) of the article, will replace existing PDFs unless used with --new')
+        parser.add_argument('--code', help='Four digit code (YYnn) of the article, will replace outdated PDFs unless used with --new')
         parser.add_argument('--lang', help='Language of the article')
         parser.add_argument('--new', action='store_true', help='Generate PDFs for new activities')
-        parser.add_argument('--all', action='store_true', help='(Re-)Generate PDFs for all activities')
-
+        parser.add_argument('--all', action='store_true', help='(Re-)Generate PDFs for all activities whose content changed')
+        parser.add_argument('--force', action='store_true', help='Render even when the content is unchanged since the last PDF')
+        parser.add_argument('--workers', type=int, default=1, help='Number of processes rendering PDFs in parallel (default: 1)')
 
     def handle(self, *args, **options):
         if options['new'] and not options['code']:
@@ -44,19 +45,62 @@ class Command(BaseCommand):
                 self.stderr.write(e)
                 self.stderr.write(f"Activity {options['code']} in {options['lang']} not found")
                 sys.exit()
+        versions = versions.select_related('master')
         self.stdout.write(f'Generating PDFs for {len(versions)} activities')
+
+        pks = []
+        labels = {}
+        results = []
         for version in versions:
             if options['new'] and version.pdf:
                 self.stdout.write(f"Skipping {version.master.code} in {version.language_code}")
+                results.append((version.master.code, version.language_code, 'skipped', 0, ''))
                 continue
-            try:
-                file_obj = version.generate_pdf()
-            except Exception as e:
-                self.stderr.write(f"{e}")
-                self.stderr.write(f"Failed to create  {version.master.code} in {version.language_code}")
-                continue
-            filename = f'astroedu-{version.master.code}-{version.language_code}.pdf'
-            version.pdf.delete(save=False)
-            version.pdf.save(filename, ContentFile(file_obj))
-            version.save()
-            self.stdout.write(f'Written {filename}')
+            pks.append(version.pk)
+            labels[version.pk] = (version.master.code, version.language_code)
+
+        workers = max(1, options['workers'])
+        if workers == 1:
+            for pk in pks:
+                try:
+                    row = write_pdf(pk, options['force'])
+                except Exception as e:
+                    row = labels[pk] + ('failed', 0, str(e))
+                results.append(self._report(row))
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                futures = {pool.submit(write_pdf, pk, options['force']): pk for pk in pks}
+                for future in as_completed(futures):
+                    try:
+                        row = future.result()
+                    except Exception as e:
+                        row = labels[futures[future]] + ('failed', 0, str(e))
+                    results.append(self._report(row))
+
+        self._summary(results)
+
+    def _report(self, row):
+        code, lang, status, elapsed, message = row
+        if status == 'failed':
+            self.stderr.write(message)
+            self.stderr.write(f"Failed to create  {code} in {lang}")
+        elif status == 'unchanged':
+            self.stdout.write(f"Skipping {code} in {lang}, unchanged")
+        else:
+            self.stdout.write(f'Written {message}')
+        return row
+
+    def _summary(self, results):
+        self.stdout.write('')
+        self.stdout.write(f"{'code':<6} {'lang':<5} {'status':<9} {'seconds':>8}")
+        for code, lang, status, elapsed, message in sorted(results, key=lambda r: (str(r[0]), r[1])):
+            line = f'{code:<6} {lang:<5} {status:<9} {elapsed:>8.1f}'
+            if status == 'failed':
+                self.stderr.write(f'{line}  {message}')
+            else:
+                self.stdout.write(line)
+        counts = {}
+        for row in results:
+            counts[row[2]] = counts.get(row[2], 0) + 1
+        self.stdout.write(', '.join(f'{count} {status}' for status, count in sorted(counts.items())))
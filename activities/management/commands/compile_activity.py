@@ -1,11 +1,11 @@
 from django.conf import settings
 
-from django_ext.compiler import PublishingBaseCommand
+from activities.management.compiler import PublishingBaseCommand
 
 
 class Command(PublishingBaseCommand):
 
-    help = 'Generate downloads for an activity'
+    help = 'Generate downloads for all activities, or for one activity and language'
 
     def __init__(self, *args, **kwargs):
         self.objdef = settings.ACTIVITY_DOWNLOADS
@@ -13,6 +13,6 @@ class Command(PublishingBaseCommand):
 
     def add_arguments(self, parser):
         # Positional arguments
-        parser.add_argument('code', help='Four digit code (YYnn) of the activity')
-        parser.add_argument('lang', help='Language of the activity')
+        parser.add_argument('code', nargs='?', help='Four digit code (YYnn) of the activity')
+        parser.add_argument('lang', nargs='?', help='Language of the activity')
         super().add_arguments(parser)
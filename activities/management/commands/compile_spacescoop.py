@@ -1,18 +1,19 @@
 from django.conf import settings
 
-from django_ext.compiler import PublishingBaseCommand
+from activities.management.compiler import PublishingBaseCommand
 
 
 class Command(PublishingBaseCommand):
 
-    help = 'Generate downloads for a Space Scoop article'
+    help = 'Generate downloads for Space Scoop articles'
 
     def __init__(self, *args, **kwargs):
-        self.objdef = settings.SPACESCOOP_DOWNLOADS
+        # Space Scoop is not part of this site: without SPACESCOOP_DOWNLOADS the command refuses to run
+        self.objdef = getattr(settings, 'SPACESCOOP_DOWNLOADS', None)
         super().__init__(*args, **kwargs)
 
     def add_arguments(self, parser):
         # Positional arguments
-        parser.add_argument('code', help='Four digit code (YYnn) of the article')
-        parser.add_argument('lang', help='Language of the article')
+        parser.add_argument('code', nargs='?', help='Four digit code (YYnn) of the article')
+        parser.add_argument('lang', nargs='?', help='Language of the article')
         super().add_arguments(parser)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from activities.models import Activity, ActivitySummary
+
+
+class Command(BaseCommand):
+    help = 'Recreates the activity summaries used by the activity lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--code', help='Only rebuild the summaries of this activity')
+
+    def handle(self, *args, **options):
+        qs = Activity.objects.all()
+        if options['code']:
+            qs = qs.filter(code=options['code'])
+        ActivitySummary.refresh_activities(qs)
+        self.stdout.write(f'{ActivitySummary.objects.count()} summaries')
@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from django.db import connections
+from django.core.management.base import BaseCommand
+
+from activities.models import PdfJob
+from activities.tasks import claim_pdf_job, init_worker, requeue_stale_pdf_jobs, run_pdf_job
+
+
+class Command(BaseCommand):
+    help = 'Renders the PDFs queued when activities are saved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of processes rendering PDFs in parallel (default: 1)')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of waiting for new jobs')
+        parser.add_argument('--sleep', type=int, default=10, help='Seconds to wait before polling an empty queue again (default: 10)')
+        parser.add_argument('--stale', type=int, default=60, help='Re-queue jobs left running for more than this many minutes (default: 60)')
+        parser.add_argument('--retry-failed', action='store_true', help='Re-queue jobs that failed before')
+
+    def handle(self, *args, **options):
+        count = requeue_stale_pdf_jobs(options['stale'])
+        if count:
+            self.stdout.write(f'Re-queued {count} stale jobs')
+        if options['retry_failed']:
+            count = PdfJob.objects.filter(status=PdfJob.STATUS_FAILED).update(status=PdfJob.STATUS_PENDING)
+            self.stdout.write(f'Re-queued {count} failed jobs')
+
+        workers = max(1, options['workers'])
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            running = set()
+            while True:
+                while len(running) < workers:
+                    claimed = claim_pdf_job()
+                    if claimed is None:
+                        break
+                    # the pool may fork a new process on submit: do not share our DB socket with it
+                    connections.close_all()
+                    running.add(pool.submit(run_pdf_job, *claimed))
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        self._report(future.result())
+                    except Exception as e:
+                        self.stderr.write(f'{e}')
+
+    def _report(self, row):
+        code, lang, status, elapsed, message = row
+        if status == 'failed':
+            self.stderr.write(f'Failed to create {code} in {lang}: {message}')
+        elif status == 'unchanged':
+            self.stdout.write(f'Skipping {code} in {lang}, unchanged')
+        else:
+            self.stdout.write(f'Written {message} in {elapsed:.1f}s')
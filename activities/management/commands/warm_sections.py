@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from activities.models import ActivityTranslation
+from activities.sections import rendered_sections
+
+
+class Command(BaseCommand):
+    help = 'Renders the sections of published activities into the cache used by the detail pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--code', help='Only warm the sections of this activity')
+        parser.add_argument('--lang', help='Only warm the sections in this language')
+
+    def handle(self, *args, **options):
+        versions = ActivityTranslation.objects.filter(master__published=True).select_related('master')
+        if options['code']:
+            versions = versions.filter(master__code=options['code'])
+        if options['lang']:
+            versions = versions.filter(language_code=options['lang'])
+        count = 0
+        for version in versions.iterator():
+            rendered_sections(version)
+            count += 1
+        self.stdout.write(f'Warmed sections of {count} translations')
@@ -0,0 +1,96 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from activities.tasks import init_worker
+from activities.utils import generate_one, get_fresh_download, get_python_thing
+
+
+def compile_one(objdef, code, lang, file_type, force=False):
+    """
+    Render one download unless the registry holds a fresh copy.
+    Returns a (code, lang, format, status, seconds, message) row.
+    """
+    start = time.time()
+    try:
+        if not force and get_fresh_download(objdef, file_type, code, lang):
+            return (code, lang, file_type, 'fresh', time.time() - start, '')
+        model = get_python_thing(objdef['model'])
+        obj = model.objects.available().language(lang).get(code=code)
+        name = generate_one(objdef, obj, file_type, force=force)
+    except Exception as e:
+        return (code, lang, file_type, 'failed', time.time() - start, str(e))
+    return (code, lang, file_type, 'rendered', time.time() - start, name)
+
+
+class PublishingBaseCommand(BaseCommand):
+    '''
+    Pre-generates the downloads described by `objdef` (see settings.ACTIVITY_DOWNLOADS) for every
+    available object and language, so that no visitor has to wait for a cold render.
+    Subclasses set `objdef` and may add the optional `code` and `lang` arguments.
+    '''
+    objdef = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', action='append', dest='formats', help='Only render this format; repeat for several (default: all configured renderers)')
+        parser.add_argument('--force', action='store_true', help='Render even when the stored download is fresh')
+        parser.add_argument('--workers', type=int, default=1, help='Number of processes rendering in parallel (default: 1)')
+
+    def get_jobs(self, options):
+        formats = options['formats'] or list(self.objdef['renderers'].keys())
+        unknown = set(formats) - set(self.objdef['renderers'].keys())
+        if unknown:
+            raise CommandError('Unknown format(s): %s' % ', '.join(sorted(unknown)))
+        model = get_python_thing(self.objdef['model'])
+        qs = model.objects.available()
+        if options.get('code'):
+            qs = qs.filter(code=options['code'])
+        jobs = []
+        for obj in qs.prefetch_related('translations'):
+            langs = [options['lang']] if options.get('lang') else obj.get_available_languages()
+            for lang in langs:
+                jobs += [(obj.code, lang, file_type) for file_type in formats]
+        return jobs
+
+    def handle(self, *args, **options):
+        if not self.objdef:
+            raise CommandError('No downloads are configured for this command')
+        jobs = self.get_jobs(options)
+        self.stdout.write(f'Compiling {len(jobs)} downloads')
+
+        results = []
+        workers = max(1, options['workers'])
+        if workers == 1:
+            for code, lang, file_type in jobs:
+                results.append(self._report(compile_one(self.objdef, code, lang, file_type, options['force'])))
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                futures = [pool.submit(compile_one, self.objdef, code, lang, file_type, options['force']) for code, lang, file_type in jobs]
+                for future in as_completed(futures):
+                    results.append(self._report(future.result()))
+
+        self._summary(results)
+
+    def _report(self, row):
+        code, lang, file_type, status, elapsed, message = row
+        if status == 'failed':
+            self.stderr.write(f'Failed to render {code} in {lang} as {file_type}: {message}')
+        elif status == 'rendered':
+            self.stdout.write(f'Written {message} in {elapsed:.1f}s')
+        return row
+
+    def _summary(self, results):
+        totals = {}
+        for code, lang, file_type, status, elapsed, message in results:
+            total = totals.setdefault(file_type, {'rendered': 0, 'fresh': 0, 'failed': 0, 'seconds': 0.0})
+            total[status] += 1
+            if status == 'rendered':
+                total['seconds'] += elapsed
+        self.stdout.write('')
+        self.stdout.write(f"{'format':<7} {'rendered':>8} {'fresh':>6} {'failed':>6} {'seconds':>8} {'average':>8}")
+        for file_type, total in sorted(totals.items()):
+            average = total['seconds'] / total['rendered'] if total['rendered'] else 0
+            self.stdout.write(f"{file_type:<7} {total['rendered']:>8} {total['fresh']:>6} {total['failed']:>6} {total['seconds']:>8.1f} {average:>8.1f}")
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0006_auto_20210707_1430'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitytranslation',
+            name='pdf_fingerprint',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the inputs the current PDF was rendered from', max_length=64),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0007_activitytranslation_pdf_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('requested', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('translation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pdf_job', to='activities.ActivityTranslation')),
+            ],
+            options={
+                'verbose_name': 'PDF job',
+                'ordering': ['requested'],
+            },
+        ),
+    ]
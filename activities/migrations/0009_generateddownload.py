@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0008_pdfjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedDownload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='Dotted path of the source model, as in the downloads settings', max_length=100)),
+                ('code', models.CharField(max_length=100)),
+                ('lang', models.CharField(blank=True, max_length=15)),
+                ('format', models.CharField(max_length=10)),
+                ('source_modified', models.DateTimeField(help_text='modification_date of the source when rendered', null=True)),
+                ('name', models.CharField(help_text='Storage key', max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('hash', models.CharField(blank=True, help_text='sha256 of the file', max_length=64)),
+                ('creation_date', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('model', 'code', 'lang', 'format')},
+            },
+        ),
+    ]
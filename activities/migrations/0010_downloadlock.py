@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0009_generateddownload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadLock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('acquired', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,90 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+from activities.utils import beautify_age_range
+
+
+def build_summaries(apps, schema_editor):
+    # ActivitySummary.refresh with the historical models, so that the lists are not empty after the deploy;
+    # plain values only, the historical translatable models cannot be instantiated
+    Activity = apps.get_model('activities', 'Activity')
+    ActivitySummary = apps.get_model('activities', 'ActivitySummary')
+
+    def titles(group):
+        through = getattr(Activity, group).through
+        result = {}
+        for activity_id, title in through.objects.order_by('metadataoption__position', 'pk').values_list('activity_id', 'metadataoption__title'):
+            result.setdefault(activity_id, []).append(title)
+        return result
+
+    ages, levels = titles('age'), titles('level')
+    authors = {}
+    for activity_id, author, institution in apps.get_model('activities', 'AuthorInstitution').objects.order_by('pk').values_list(
+            'activity_id', 'author__name', 'institution__name'):
+        authors.setdefault(activity_id, []).append(', '.join([author, institution]))
+    main_visuals = {}
+    for activity_id, name in apps.get_model('activities', 'Attachment').objects.filter(main_visual=True).order_by(
+            '-show', 'position', 'id').values_list('hostmodel_id', 'file'):
+        main_visuals.setdefault(activity_id, name)
+    values = {}
+    for pk, code, time, published, featured, release_date, embargo_date in Activity.objects.values_list(
+            'pk', 'code', 'time__title', 'published', 'featured', 'release_date', 'embargo_date'):
+        values[pk] = {
+            'code': code,
+            'age_range': beautify_age_range(ages.get(pk, [])),
+            'levels': ', '.join(levels.get(pk, [])),
+            'time': time or '',
+            'main_visual': main_visuals.get(pk) or '',
+            'author_list': '; '.join(authors.get(pk, [])),
+            'published': published,
+            'featured': featured,
+            'release_date': release_date,
+            'embargo_date': embargo_date,
+        }
+    summaries = []
+    for master_id, language_code, title, slug, teaser, theme in apps.get_model('activities', 'ActivityTranslation').objects.values_list(
+            'master_id', 'language_code', 'title', 'slug', 'teaser', 'theme'):
+        if master_id in values:
+            summaries.append(ActivitySummary(activity_id=master_id, language_code=language_code, title=title, slug=slug,
+                                             teaser=teaser, theme=theme, **values[master_id]))
+    ActivitySummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0010_downloadlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivitySummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('featured', models.BooleanField(default=False)),
+                ('published', models.BooleanField(default=True)),
+                ('release_date', models.DateTimeField()),
+                ('embargo_date', models.DateTimeField(blank=True, null=True)),
+                ('language_code', models.CharField(db_index=True, max_length=15)),
+                ('code', models.CharField(max_length=4)),
+                ('title', models.CharField(max_length=255)),
+                ('slug', models.CharField(max_length=200)),
+                ('teaser', models.TextField(blank=True)),
+                ('theme', models.CharField(blank=True, max_length=40)),
+                ('age_range', models.CharField(blank=True, max_length=255)),
+                ('levels', models.CharField(blank=True, max_length=255)),
+                ('time', models.CharField(blank=True, max_length=255)),
+                ('main_visual', models.FileField(blank=True, max_length=255, upload_to='')),
+                ('author_list', models.TextField(blank=True)),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='activities.Activity')),
+            ],
+            options={
+                'verbose_name_plural': 'activity summaries',
+                'ordering': ['-release_date'],
+                'abstract': False,
+                'unique_together': {('activity', 'language_code')},
+                'index_together': {('language_code', 'published', 'release_date')},
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
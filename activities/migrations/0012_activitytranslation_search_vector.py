@@ -0,0 +1,33 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+import activities.db
+
+
+def fill_search_vectors(apps, schema_editor):
+    if not activities.db.is_postgres(schema_editor):
+        return
+    from activities.models import ActivityTranslation
+    # the historical model has no methods, so build the expression with the current one
+    apps.get_model('activities', 'ActivityTranslation').objects.update(search_vector=ActivityTranslation.search_vector_expression())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0011_activitysummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitytranslation',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        activities.db.PostgresAddIndex(
+            model_name='activitytranslation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='activities_translation_fts'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+# the through tables of the metadata M2M fields only have the (activity_id, metadataoption_id) unique index:
+# add the reverse one, so EXISTS filters and facet counts can start from the selected options
+M2M_TABLES = (
+    'activities_activity_age',
+    'activities_activity_level',
+    'activities_activity_skills',
+    'activities_activity_learning',
+    'activities_activity_astronomical_categories',
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0012_activitytranslation_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS %s_option_activity ON %s (metadataoption_id, activity_id)' % (table, table),
+            'DROP INDEX IF EXISTS %s_option_activity' % table,
+        )
+        for table in M2M_TABLES
+    ]
@@ -0,0 +1,25 @@
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+import activities.db
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0013_metadata_option_indexes'),
+    ]
+
+    operations = [
+        # does nothing on other databases
+        TrigramExtension(),
+        activities.db.PostgresAddIndex(
+            model_name='activitytranslation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='activities_translation_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        activities.db.PostgresAddIndex(
+            model_name='activitytranslation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['keywords'], name='activities_keywords_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0014_translation_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitysummary',
+            name='modification_date',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,3 +1,6 @@
 from .publishing import *
 from .activities import *
 from .spaceawe import *
+from .jobs import *
+from .downloads import *
+from .summaries import *
@@ -1,13 +1,14 @@
 import uuid
 import os
-import io
+import hashlib
 
 from autoslug import AutoSlugField
 from django.conf import settings
-from django.contrib.staticfiles import finders
-from django.contrib.sites.models import Site
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.files.storage import default_storage
-from django.db import models
+from django.db import connection, models
+from django.db.models import Case, Count, Exists, F, OuterRef, Prefetch, Q, Value, When
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.translation import activate
@@ -15,11 +16,12 @@ from parler.managers import TranslatableManager, TranslatableQuerySet
 from parler.models import TranslatableModel, TranslatedFieldsModel
 from sorl.thumbnail import ImageField
 from urllib.parse import urlparse
-from weasyprint import HTML, CSS
 
 from .publishing import PublishingModel, PublishingManager
 from .spaceawe import SpaceaweModel
 from activities import utils
+from activities.pdf import render_context
+from activities.site import absolute_url
 from institutions.models import Institution, Person, Location
 
 from search.mixins import SearchModel
@@ -46,6 +48,17 @@ ACTIVITY_SECTIONS = (
     ('conclusion', 'Conclusion'),
 )
 
+# full text search weight of the translated fields, A is the highest
+ACTIVITY_SEARCH_WEIGHTS = (
+    ('title', 'A'),
+    ('keywords', 'B'),
+    ('teaser', 'B'),
+    ('abstract', 'B'),
+    ('description', 'C'),
+    ('goals', 'C'),
+    ('objectives', 'C'),
+) + tuple((section_code, 'D') for section_code, section_title in ACTIVITY_SECTIONS if section_code not in ('abstract', 'goals', 'objectives'))
+
 ACTIVITY_METADATA = (
     ('age', 'Age',
         {'display': 'age_range', }),
@@ -72,6 +85,11 @@ ACTIVITY_METADATA = (
 
 METADATA_OPTION_CHOICES = [(x[0], x[1]) for x in ACTIVITY_METADATA]
 
+# how each metadata group is stored on Activity
+ACTIVITY_METADATA_FK = ('time', 'group', 'supervised', 'cost', 'location', )
+ACTIVITY_METADATA_M2M = ('age', 'level', 'skills', 'learning', 'astronomical_categories', )
+ACTIVITY_METADATA_GROUPS = tuple(meta_code for meta_code, meta_title, meta_options in ACTIVITY_METADATA)
+
 
 class MetadataOption(models.Model):
     group = models.CharField(max_length=50, blank=False, choices=METADATA_OPTION_CHOICES)
@@ -92,12 +110,55 @@ class MetadataOptionsManager(models.Manager):
         return super().get_queryset().order_by('position')
 
 
+def metadata_conditions(selection, prefix=''):
+    '''
+    Filter expressions for a metadata selection {group: [option codes]}, for .filter(*conditions):
+    an activity matches when it has any of the codes of every group in the selection.
+    M2M groups become EXISTS subqueries on the through table, so combining groups and values never
+    multiplies rows (no .distinct() needed). `prefix` is the relation to the activity from the filtered model.
+    '''
+    result = []
+    for group, codes in selection.items():
+        if group not in ACTIVITY_METADATA_GROUPS or not codes:
+            continue
+        options = MetadataOption.objects.filter(group=group, code__in=codes).values('pk')
+        if group in ACTIVITY_METADATA_M2M:
+            through = getattr(Activity, group).through.objects.filter(activity=OuterRef(prefix or 'pk'), metadataoption__in=options)
+            result.append(Exists(through))
+        else:
+            result.append(Q(**{'%s%s__in' % (prefix + '__' if prefix else '', group): options}))
+    return result
+
+
 class ActivityQuerySet(TranslatableQuerySet):
-    pass
+
+    def filter_metadata(self, selection):
+        'Activities having any of the codes of every group in selection ({group: [option codes]})'
+        return self.filter(*metadata_conditions(selection))
+
+    def facet_counts(self):
+        '''
+        Number of activities of this queryset per MetadataOption, for every ACTIVITY_METADATA group:
+        {group: {option code: count}}. One query, a UNION ALL of one GROUP BY per group.
+        '''
+        # a clean base, so that filters on level/age do not restrict the joins counted below
+        base = Activity.objects.filter(pk__in=self.order_by().values('pk')).order_by()
+        parts = [
+            base.values(option=F('%s__code' % group)).annotate(
+                count=Count('pk'), facet=Value(group, output_field=models.CharField())).values_list('facet', 'option', 'count')
+            for group in ACTIVITY_METADATA_GROUPS
+        ]
+        result = {group: {} for group in ACTIVITY_METADATA_GROUPS}
+        for group, option, count in parts[0].union(*parts[1:], all=True):
+            # activities without an option for the group come back as None
+            if option is not None:
+                result[group][option] = count
+        return result
 
 
-class ActivityManager(PublishingManager, TranslatableManager):
-    queryset_class = ActivityQuerySet
+# parler 2 builds its manager with from_queryset(): a queryset_class attribute would be ignored
+class ActivityManager(PublishingManager, TranslatableManager.from_queryset(ActivityQuerySet)):
+    pass
 
 
 class Activity(TranslatableModel, PublishingModel, SpaceaweModel, SearchModel):
@@ -153,18 +214,20 @@ class Activity(TranslatableModel, PublishingModel, SpaceaweModel, SearchModel):
             result.append(item.author.citable_name)
         return '; '.join(result)
 
+    # the helpers below iterate .all() instead of calling .filter(), so that they are answered
+    # from the caches filled by add_prefetch_related
+
     @property
     def main_visual(self):
-        result = None
-        images = self.attachment_set.filter(main_visual=True)
-        if images:
-            result = images[0].file
-        return result
+        for item in self.attachment_set.all():
+            if item.main_visual:
+                return item.file
+        return None
 
     @property
     def main_video_link(self):
-        video_links = self.link_set.filter(main=True, type=Link.TYPE_VIDEO)
-        return video_links.last() if video_links else None
+        video_links = [x for x in self.link_set.all() if x.main and x.type == Link.TYPE_VIDEO]
+        return max(video_links, key=lambda x: x.pk) if video_links else None
 
     def is_translation_fallback(self):
         return not self.has_translation(self.language_code)
@@ -176,20 +239,27 @@ class Activity(TranslatableModel, PublishingModel, SpaceaweModel, SearchModel):
     @classmethod
     def add_prefetch_related(self, qs, prefix=""):
         # # add _after_ qs.filter! see django docs on prefetch_related
+        # everything metadata_aslist(), author_list(), main_visual and the attachment lists need,
+        # so that listing activities costs the same number of queries whatever the page size
         if prefix:
             prefix += '__'
+            # select_related cannot follow the relation to the prefix
+            qs = qs.prefetch_related(*['%s%s' % (prefix, field) for field in ACTIVITY_METADATA_FK])
+        else:
+            qs = qs.select_related(*ACTIVITY_METADATA_FK)
         qs = qs.prefetch_related('%stranslations' % prefix)
-        # qs = qs.prefetch_related('{}metadataoption'.format(prefix))
-        # qs = qs.prefetch_related('%scategories' % prefix)
-        # qs = qs.prefetch_related('%scategories__translations' % prefix)
-        # qs = qs.prefetch_related('%simages' % prefix)
+        qs = qs.prefetch_related(*['%s%s' % (prefix, field) for field in ACTIVITY_METADATA_M2M])
+        qs = qs.prefetch_related(Prefetch('%sauthors' % prefix, queryset=AuthorInstitution.objects.select_related('author', 'institution')))
+        qs = qs.prefetch_related('%sattachment_set' % prefix)
+        qs = qs.prefetch_related('%slanguageattachment_set__translations' % prefix)
+        qs = qs.prefetch_related('%slink_set__translations' % prefix)
         return qs
 
     def attachment_list(self):
-        return self.attachment_set.filter(show=True)
+        return [x for x in self.attachment_set.all() if x.show]
 
     def languageattachment_list(self):
-        return self.languageattachment_set.filter(show=True)
+        return [x for x in self.languageattachment_set.all() if x.show]
 
     def metadata_aslist(self):
         result = []
@@ -224,7 +294,7 @@ class Activity(TranslatableModel, PublishingModel, SpaceaweModel, SearchModel):
         return '%s' % (self.code)
 
     def get_absolute_url(self):
-        return "https://{}{}".format(Site.objects.get(id=1).domain,reverse('activities:detail-code', kwargs={'code': self.code, }))
+        return absolute_url(reverse('activities:detail-code', kwargs={'code': self.code, }))
 
     def get_short_url_full(self):
         if settings.SHORT_NAME == 'astroedu':
@@ -233,7 +303,8 @@ class Activity(TranslatableModel, PublishingModel, SpaceaweModel, SearchModel):
             return None
 
     def get_absolute_pdf(self):
-        return "https://{}/{}".format(Site.objects.get(id=1).domain,self.pdf)
+        if self.pdf:
+            return absolute_url(self.pdf.url)
 
 
     def get_footer_disclaimer(self):
@@ -279,6 +350,59 @@ class ActivityTranslation(TranslatedFieldsModel):
     reference = models.TextField(blank=True, verbose_name='References')
 
     pdf = models.FileField(upload_to='pdf/', blank=True, null=True, help_text="PDF will be autogenerated after publication. Do not upload one.")
+    pdf_fingerprint = models.CharField(max_length=64, blank=True, editable=False, help_text='Hash of the inputs the current PDF was rendered from')
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    @staticmethod
+    def search_config_expression():
+        'The text search configuration of each row, from its language_code'
+        whens = [When(language_code=code, then=Value(config)) for code, config in settings.SEARCH_CONFIGS.items()]
+        return Case(*whens, default=Value('simple'), output_field=models.CharField())
+
+    @classmethod
+    def search_vector_expression(cls):
+        config = cls.search_config_expression()
+        vectors = [SearchVector(field, weight=weight, config=config) for field, weight in ACTIVITY_SEARCH_WEIGHTS]
+        result = vectors[0]
+        for vector in vectors[1:]:
+            result = result + vector
+        return result
+
+    @classmethod
+    def update_search_vectors(cls, qs=None):
+        'Recompute the stored search_vector of the translations in qs (all of them by default), in one query'
+        if connection.vendor != 'postgresql':
+            return 0
+        if qs is None:
+            qs = cls.objects.all()
+        return qs.update(search_vector=cls.search_vector_expression())
+
+    def pdf_inputs(self):
+        'Everything that ends up in the rendered PDF, as a list of strings'
+        master = self.master
+        result = [self.language_code, self.title, self.teaser, self.keywords, self.acknowledgement]
+        result += [getattr(self, section_code) for section_code, section_title in ACTIVITY_SECTIONS]
+        result += ['%s:%s' % (meta_code, value) for meta_code, meta_title, value in master.metadata_aslist()]
+        result += [master.code, master.doi, str(master.release_date), master.author_list(), master.citable_author_list()]
+        result += ['%s:%s' % (a.file.name, a.display_name()) for a in master.attachment_list()]
+        result.append(master.main_visual.name if master.main_visual else '')
+        result += ['%s:%s' % (a.file.name, a.display_name()) for a in master.languageattachment_list()]
+        result.append(render_context.stylesheet_hash)
+        return result
+
+    def get_pdf_fingerprint(self):
+        digest = hashlib.sha256()
+        for item in self.pdf_inputs():
+            digest.update(str(item).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def pdf_is_stale(self, fingerprint=None):
+        if not self.pdf:
+            return True
+        if fingerprint is None:
+            fingerprint = self.get_pdf_fingerprint()
+        return fingerprint != self.pdf_fingerprint
 
 
     def generate_pdf(self, no_trans=False, path='', lang_code='en'):
@@ -291,16 +415,8 @@ class ActivityTranslation(TranslatedFieldsModel):
             'sections': ACTIVITY_SECTIONS,
             'long_meta' : ['skills','learning']
         }
-        with open(finders.find('css/print.css')) as f:
-            css = CSS(string=f.read())
         html_string = render_to_string('activities/activity_detail_print.html', context)
-        html = HTML(string=html_string, base_url="https://astroedu.iau.org")
-        # filepath = Path(path) / filename
-        fileobj = io.BytesIO()
-        html.write_pdf(fileobj, stylesheets=[css])
-        # return filepath
-        pdf = fileobj.getvalue()
-        fileobj.close()
+        pdf = render_context.write_pdf(html_string, base_url=settings.SITE_URL)
         return pdf
 
     class Meta:
@@ -308,6 +424,11 @@ class ActivityTranslation(TranslatedFieldsModel):
             ('language_code', 'master'),
             ('language_code', 'slug')
         )
+        indexes = [
+            GinIndex(fields=['search_vector'], name='activities_translation_fts'),
+            GinIndex(fields=['title'], name='activities_translation_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['keywords'], name='activities_keywords_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
 
 class AuthorInstitution(models.Model):
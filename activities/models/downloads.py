@@ -0,0 +1,36 @@
+from django.db import models
+
+
+class GeneratedDownload(models.Model):
+    '''
+    A rendered download (pdf, epub, zip...) stored in the default storage, and the version of the
+    source object it was rendered from. Freshness checks only look at this table, so they work the
+    same on local disk and on remote object storage.
+    '''
+    model = models.CharField(max_length=100, help_text='Dotted path of the source model, as in the downloads settings')
+    code = models.CharField(max_length=100)
+    lang = models.CharField(max_length=15, blank=True)
+    format = models.CharField(max_length=10)
+    source_modified = models.DateTimeField(null=True, help_text='modification_date of the source when rendered')
+    name = models.CharField(max_length=255, help_text='Storage key')
+    size = models.BigIntegerField(default=0)
+    hash = models.CharField(max_length=64, blank=True, help_text='sha256 of the file')
+    creation_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        unique_together = (('model', 'code', 'lang', 'format'),)
+
+
+class DownloadLock(models.Model):
+    '''
+    Held while a download is being rendered on demand, so concurrent requests for the same
+    download wait for one render instead of starting their own.
+    '''
+    key = models.CharField(max_length=255, unique=True)
+    acquired = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,34 @@
+from django.db import models
+from django.utils.timezone import now
+
+from .activities import ActivityTranslation
+
+
+class PdfJob(models.Model):
+    '''
+    A pending PDF render for one translation. There is at most one job per translation, so
+    repeated saves collapse into a single render; `requested` moves forward on every save.
+    '''
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+
+    STATUSES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    translation = models.OneToOneField(ActivityTranslation, related_name='pdf_job', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING, db_index=True)
+    requested = models.DateTimeField(default=now)
+    started = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return '%s (%s)' % (self.translation_id, self.status)
+
+    class Meta:
+        ordering = ['requested']
+        verbose_name = 'PDF job'
@@ -1,5 +1,10 @@
+import math
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
-from django.db.models import Q
+from django.db.models import Min, Q
 from django.utils.timezone import now
 
 
@@ -19,6 +24,78 @@ def publishing_user_passes_test(test_func):
     return lambda user: test_func(user)
 
 
+def released_q(prefix='', current=None):
+    'Condition of the released objects: published, after their release date and out of embargo'
+    current = current or now()
+    return Q(**{prefix + 'published': True}) & \
+        Q(**{prefix + 'release_date__lte': current}) & \
+        (Q(**{prefix + 'embargo_date__isnull': True}) | Q(**{prefix + 'embargo_date__lte': current}))
+
+
+def _generation_key(model):
+    return 'publishing:%s:generation' % model._meta.label_lower
+
+
+def _generation(model):
+    key = _generation_key(model)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def _publishing_state(model):
+    '''
+    (next transition, as of) of model: the datetime of the next release or embargo end among its published
+    objects (None when nothing is scheduled) and the instant it was computed at. No transition falls between
+    the two, so filtering on "as of" selects the same objects as filtering on now() until the next one.
+    Cached until that moment (at most PUBLISHING_CACHE_TIMEOUT), under a generation that
+    invalidate_publishing_state bumps: a value computed while an object was being saved is stored
+    under the old generation and never read.
+    '''
+    key = 'publishing:%s:%s' % (model._meta.label_lower, _generation(model))
+    current = now()
+    state = cache.get(key)
+    if state is None or (state[0] is not None and state[0] <= current):
+        upcoming = model._base_manager.filter(published=True).aggregate(
+            release=Min('release_date', filter=Q(release_date__gt=current)),
+            embargo=Min('embargo_date', filter=Q(embargo_date__gt=current)))
+        state = (min([date for date in upcoming.values() if date is not None], default=None), current)
+        timeout = settings.PUBLISHING_CACHE_TIMEOUT
+        if state[0] is not None:
+            timeout = min(timeout, math.ceil((state[0] - current).total_seconds()))
+        cache.set(key, state, timeout)
+    return state
+
+
+def model_transition(model):
+    'Datetime of the next release or embargo end among the published objects of model, None when nothing is scheduled'
+    return _publishing_state(model)[0]
+
+
+def released_as_of(model):
+    'Instant to filter the released objects of model on: the same for every query until the next transition'
+    return _publishing_state(model)[1]
+
+
+def invalidate_publishing_state(model):
+    try:
+        cache.incr(_generation_key(model))
+    except ValueError:
+        cache.set(_generation_key(model), 1, None)
+
+
+def publishing_models():
+    return [model for model in apps.get_models() if issubclass(model, PublishingModel)]
+
+
+def next_transition():
+    'When the next object of any publishing model gets released or leaves embargo (None: nothing scheduled)'
+    transitions = [model_transition(model) for model in publishing_models()]
+    return min([date for date in transitions if date is not None], default=None)
+
+
 class PublishingManager(models.Manager):
 
     def featured(self):
@@ -34,22 +111,21 @@ class PublishingManager(models.Manager):
             result = super().get_queryset()
         elif permission_embargoed and permission_embargoed(user):
             # return objects that are either .is_released and .is_embargoed
+            current = released_as_of(self.model)
             q = Q(published=True) & \
-                (Q(embargo_date__isnull=True) | Q(embargo_date__lte=now()))
+                (Q(embargo_date__isnull=True) | Q(embargo_date__lte=current))
             result = super().get_queryset().filter(q)
         else:
             # only return objects that .is_released
-            q = Q(published=True) & \
-                Q(release_date__lte=now()) & \
-                (Q(embargo_date__isnull=True) | Q(embargo_date__lte=now()))
-            result = super().get_queryset().filter(q)
+            result = super().get_queryset().filter(released_q(current=released_as_of(self.model)))
         return result
 
     def embargoed(self):
         # only return objects that .is_embargoed
+        current = released_as_of(self.model)
         q = Q(published=True) & \
-            Q(release_date__gt=now()) & \
-            (Q(embargo_date__isnull=True) | Q(embargo_date__lte=now()))
+            Q(release_date__gt=current) & \
+            (Q(embargo_date__isnull=True) | Q(embargo_date__lte=current))
         return super().get_queryset().filter(q)
 
 
@@ -86,15 +162,6 @@ class PublishingModel(models.Model):
             result.append('under embargo')
         return result
 
-    @classmethod
-    def sitemap(cls, priority=None):
-        from django.contrib.sitemaps import GenericSitemap
-        object_list = {
-            'queryset': cls.objects.available(),  #TODO make sure this only shows _released objects
-            'date_field': 'modification_date',
-        }
-        return GenericSitemap(object_list, priority=priority)
-
     class Meta:
         abstract = True
         ordering = ['-release_date']
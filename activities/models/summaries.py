@@ -0,0 +1,65 @@
+from django.db import models
+
+from .publishing import PublishingModel, PublishingManager
+from .activities import Activity
+
+
+class ActivitySummary(PublishingModel):
+    '''
+    Read model for activity lists and cards: one row per activity and language, with everything
+    activity_list_item.html and featured_item.html display, so a list is a single query.
+    Kept in sync by activities.signals; `manage.py rebuild_summaries` recreates all rows.
+    modification_date moves on every refresh, so it also covers what the activity pages and downloads
+    show from related objects (metadata options, authors, attachments) in the page validators and the
+    downloads registry.
+    '''
+    activity = models.ForeignKey(Activity, related_name='summaries', on_delete=models.CASCADE)
+    language_code = models.CharField(max_length=15, db_index=True)
+    code = models.CharField(max_length=4)
+    title = models.CharField(max_length=255)
+    slug = models.CharField(max_length=200)
+    teaser = models.TextField(blank=True)
+    theme = models.CharField(max_length=40, blank=True)
+    age_range = models.CharField(max_length=255, blank=True)
+    levels = models.CharField(max_length=255, blank=True)
+    time = models.CharField(max_length=255, blank=True)
+    main_visual = models.FileField(max_length=255, blank=True)
+    author_list = models.TextField(blank=True)
+    modification_date = models.DateTimeField(auto_now=True)
+
+    objects = PublishingManager()
+
+    def __str__(self):
+        return '%s (%s)' % (self.code, self.language_code)
+
+    @classmethod
+    def refresh(cls, activity):
+        '''Recreate the summaries of `activity`, one per translation; pass it through Activity.add_prefetch_related'''
+        languages = []
+        values = {
+            'code': activity.code,
+            'age_range': activity.age_range(),
+            'levels': activity.levels_joined(),
+            'time': activity.time.title if activity.time_id else '',
+            'main_visual': activity.main_visual.name if activity.main_visual else '',
+            'author_list': activity.author_list(),
+            'published': activity.published,
+            'featured': activity.featured,
+            'release_date': activity.release_date,
+            'embargo_date': activity.embargo_date,
+        }
+        for translation in activity.translations.all():
+            languages.append(translation.language_code)
+            defaults = dict(values, title=translation.title, slug=translation.slug, teaser=translation.teaser, theme=translation.theme)
+            cls.objects.update_or_create(activity=activity, language_code=translation.language_code, defaults=defaults)
+        cls.objects.filter(activity=activity).exclude(language_code__in=languages).delete()
+
+    @classmethod
+    def refresh_activities(cls, qs):
+        for activity in Activity.add_prefetch_related(qs):
+            cls.refresh(activity)
+
+    class Meta(PublishingModel.Meta):
+        unique_together = (('activity', 'language_code'),)
+        index_together = (('language_code', 'published', 'release_date'),)
+        verbose_name_plural = 'activity summaries'
@@ -0,0 +1,165 @@
+import io
+import os
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.storage import default_storage
+from weasyprint import HTML, CSS, default_url_fetcher
+from weasyprint.fonts import FontConfiguration
+
+from activities import utils
+
+
+class AssetCache:
+    """
+    Least recently used cache of fetched assets, bounded by the total size of the cached bytes.
+    Values are (bytes, mime type, encoding, redirected url) tuples.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def set(self, key, item):
+        size = len(item[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._size -= len(self._items.pop(key)[0])
+            self._items[key] = item
+            self._size += size
+            while self._size > self.max_bytes:
+                old_key, old_item = self._items.popitem(last=False)
+                self._size -= len(old_item[0])
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+asset_cache = AssetCache()
+
+
+def _read_local(url):
+    """
+    Read an asset served by this site straight from the staticfiles finders or the default storage.
+    Returns None for URLs that are not ours.
+    """
+    parsed = urlparse(url)
+    if parsed.netloc and parsed.netloc != urlparse(settings.SITE_URL).netloc:
+        # remote storage (e.g. S3) serves media under its own host
+        media_base = urlparse(default_storage.url(''))
+        if parsed.netloc != media_base.netloc or not parsed.path.startswith(media_base.path):
+            return None
+        local = unquote(parsed.path[len(media_base.path):])
+        with default_storage.open(local) as f:
+            return f.read(), local
+    try:
+        full, local = utils.local_resource(parsed.path)
+    except utils.UnsupportedMediaPathException:
+        return None
+    if full.startswith(settings.STATIC_ROOT):
+        if not os.path.exists(full):
+            full = finders.find(local)
+        with open(full, 'rb') as f:
+            return f.read(), local
+    with default_storage.open(local) as f:
+        return f.read(), local
+
+
+def local_url_fetcher(url):
+    """
+    WeasyPrint url_fetcher: site, MEDIA_URL and STATIC_URL assets are read locally instead of
+    over HTTP, and everything fetched is kept in asset_cache for the next documents of the batch.
+    """
+    if urlparse(url).scheme not in ('', 'http', 'https'):
+        return default_url_fetcher(url)
+    item = asset_cache.get(url)
+    if item is None:
+        found = _read_local(url)
+        if found is not None:
+            data, name = found
+            item = (data, mimetypes.guess_type(name)[0], None, url)
+        else:
+            result = default_url_fetcher(url)
+            if 'file_obj' in result:
+                data = result['file_obj'].read()
+                result['file_obj'].close()
+            else:
+                data = result['string']
+            item = (data, result.get('mime_type'), result.get('encoding'), result.get('redirected_url', url))
+        asset_cache.set(url, item)
+    data, mime_type, encoding, redirected_url = item
+    return {'string': data, 'mime_type': mime_type, 'encoding': encoding, 'redirected_url': redirected_url}
+
+
+class PdfRenderContext:
+    """
+    State shared by all the PDFs rendered in a process: the parsed print stylesheet and the
+    WeasyPrint font configuration. The stylesheet is parsed once and re-parsed only when the file
+    on disk changes (its mtime), so batch jobs do not pay for CSS parsing and font loading per document.
+    """
+
+    def __init__(self, stylesheet='css/print.css', url_fetcher=local_url_fetcher):
+        self.stylesheet_name = stylesheet
+        self.url_fetcher = url_fetcher
+        self._lock = threading.Lock()
+        self._key = None
+        self._state = None
+
+    def _current(self):
+        'Returns (stylesheet, stylesheet hash, font configuration), re-parsing the file if it changed'
+        path = finders.find(self.stylesheet_name)
+        key = (path, os.path.getmtime(path))
+        if key != self._key:
+            with self._lock:
+                if key != self._key:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    font_config = FontConfiguration()
+                    css = CSS(string=data.decode('utf-8'), font_config=font_config)
+                    self._state = (css, hashlib.sha256(data).hexdigest(), font_config)
+                    self._key = key
+        return self._state
+
+    @property
+    def stylesheet(self):
+        return self._current()[0]
+
+    @property
+    def stylesheet_hash(self):
+        'sha256 of the current stylesheet file, without re-reading it'
+        return self._current()[1]
+
+    @property
+    def font_config(self):
+        return self._current()[2]
+
+    def write_pdf(self, html_string, base_url=None):
+        'Render an HTML string to PDF bytes with the shared stylesheet and fonts'
+        css, css_hash, font_config = self._current()
+        html = HTML(string=html_string, base_url=base_url, url_fetcher=self.url_fetcher)
+        fileobj = io.BytesIO()
+        html.write_pdf(fileobj, stylesheets=[css], font_config=font_config)
+        pdf = fileobj.getvalue()
+        fileobj.close()
+        return pdf
+
+
+render_context = PdfRenderContext()
@@ -1,49 +1,44 @@
 import os
 import re
-import subprocess
 
 from django.conf import settings
 from django.template.loader import get_template
 from django.template import Context
 from sorl.thumbnail import get_thumbnail
-from contrib.epub.epub import Document as EpubDocument
 
 from activities import utils
-from .pdf import renderer as pdfrenderer
-from .rtf import renderer as rtfrenderer
+from . import archive
+
+
+# the pdf, rtf and epub renderers import their toolkits lazily, so that a missing one does not
+# take down the renderers that do not need it
 
 
 def pdf(obj, path, site_url=None):
-    pdfrenderer.Renderer().generate_one(obj, path)
+    translation = obj.translations.get(language_code=obj.get_current_language())
+    if translation.pdf and not translation.pdf_is_stale():
+        # the publishing queue already rendered this version
+        with translation.pdf.open('rb') as f:
+            data = f.read()
+    else:
+        data = translation.generate_pdf(lang_code=translation.language_code)
+    with open(path, 'wb') as f:
+        f.write(data)
 
 
 def rtf(obj, path, site_url=None):
+    from .rtf import renderer as rtfrenderer
     rtfrenderer.render(obj, path)
 
 
 def zip(obj, path, site_url=None):
-    result = 0
-    zipoptions = '-jX'
-    subprocess.call(['rm', '-f', path])
-    for f in obj.attachment_list():
-        if f.file:
-            # skip missing files
-            result += subprocess.call(['zip', zipoptions, path, f.file.path])
-
-    for f in obj.attachment_list():
-        if f.file:
-            # skip missing files
-            result += subprocess.call(['zip', zipoptions, path, f.file.path])
-
-    for f in obj.languageattachment_list():
-        if f.file:
-            # skip missing files
-            result += subprocess.call(['zip', zipoptions, path, f.file.path])
-
-    return result
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        archive.write_zip(archive.attachment_files(obj), f)
 
 
 def epub(obj, path, site_url=None):
+    from contrib.epub.epub import Document as EpubDocument
     from activities.models import ACTIVITY_SECTIONS
     EPUB_ASSETS_ROOT = os.path.join(settings.BASE_DIR, 'share', 'epub-assets')
     template = get_template('activities/activity_epub.html')
@@ -69,7 +64,7 @@ def epub(obj, path, site_url=None):
         'title': obj.title + ' - astroEDU Activity',
         'author': obj.author_list(),
         'description': obj.teaser,
-        'book_id': settings.SITE_URL + obj.get_absolute_url(),
+        'book_id': obj.get_absolute_url(),
         'book_id_type': 'URI',
         'language': 'en',
     }
@@ -0,0 +1,102 @@
+import os
+import hashlib
+import tempfile
+import zipfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ZipStream:
+    'Write-only, unseekable file object: zipfile writes to it, we drain what it wrote'
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        result = b''.join(self._chunks)
+        self._chunks = []
+        return result
+
+
+def attachment_files(obj):
+    '''
+    Returns (name in archive, storage name) for every file in the attachment lists, each file once.
+    Names are flattened like `zip -j` did, with a numeric suffix on clashes.
+    '''
+    result = []
+    seen_files = set()
+    seen_names = set()
+    for f in list(obj.attachment_list()) + list(obj.languageattachment_list()):
+        if not f.file or f.file.name in seen_files:
+            # skip missing files
+            continue
+        seen_files.add(f.file.name)
+        arcname = os.path.basename(f.file.name)
+        base, ext = os.path.splitext(arcname)
+        i = 1
+        while arcname in seen_names:
+            arcname = '%s-%d%s' % (base, i, ext)
+            i += 1
+        seen_names.add(arcname)
+        result.append((arcname, f.file.name))
+    return result
+
+
+def _file_version(name):
+    'Size and modification time of a stored file: replacing it under the same name changes them'
+    try:
+        modified = default_storage.get_modified_time(name).isoformat()
+    except NotImplementedError:
+        modified = ''
+    return '%s\0%s' % (default_storage.size(name), modified)
+
+
+def archive_name(obj, files):
+    'Storage name of the cached archive, derived from the names and versions of the files in it'
+    digest = hashlib.sha256()
+    for arcname, name in files:
+        digest.update(('%s\0%s\0%s\0' % (arcname, name, _file_version(name))).encode('utf-8'))
+    return 'zip/astroedu-%s-%s-%s.zip' % (obj.code, obj.get_current_language(), digest.hexdigest()[:16])
+
+
+def iter_zip(files):
+    'Yields the archive of `files` chunk by chunk, reading them from the default storage'
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for arcname, name in files:
+            with default_storage.open(name) as src, archive.open(arcname, 'w') as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    dst.write(chunk)
+                    yield stream.pop()
+            yield stream.pop()
+    yield stream.pop()
+
+
+def write_zip(files, fileobj):
+    for chunk in iter_zip(files):
+        fileobj.write(chunk)
+
+
+def stream_and_cache(files, name):
+    '''
+    Yields the archive like iter_zip, keeping a copy that is saved as `name` once the whole
+    archive was sent; an interrupted download leaves nothing behind.
+    '''
+    with tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024) as spool:
+        for chunk in iter_zip(files):
+            spool.write(chunk)
+            yield chunk
+        spool.seek(0)
+        if not default_storage.exists(name):
+            default_storage.save(name, File(spool))
@@ -1,5 +1,10 @@
+from functools import lru_cache
+
+from django.utils.translation import get_language
 from weasyprint import HTML, CSS
 
+from activities.pdf import local_url_fetcher
+
 
 class PdfGenerator:
     """
@@ -19,6 +24,8 @@ class PdfGenerator:
       snippet was written at the time of the release 47, it might break in the future.
     - This generator draws its inspiration and, also a bit of its implementation, from this
       discussion in the library github issues: https://github.com/Kozea/WeasyPrint/issues/92
+    - Header and footer layouts only depend on their html, so they are computed once per
+      html and language and reused by every document of a batch (see `_overlay`).
     """
     OVERLAY_LAYOUT = '@page {size: A4 portrait; margin: 0;}'
 
@@ -65,22 +72,7 @@ class PdfGenerator:
         element_height: float
             The height of this element, which will be then translated in a html height
         """
-        html = HTML(
-            string=getattr(self, f'{element}_html'),
-            base_url=self.base_url,
-        )
-        element_doc = html.render(stylesheets=[CSS(string=self.OVERLAY_LAYOUT)])
-        element_page = element_doc.pages[0]
-        element_body = PdfGenerator.get_element(element_page._page_box.all_children(), 'body')
-        element_body = element_body.copy_with_children(element_body.all_children())
-        element_html = PdfGenerator.get_element(element_page._page_box.all_children(), element)
-
-        if element == 'header':
-            element_height = element_html.height
-        if element == 'footer':
-            element_height = element_page.height - element_html.position_y
-
-        return element_body, element_height
+        return _overlay(element, getattr(self, f'{element}_html'), self.base_url, get_language())
 
     def _apply_overlay_on_main(self, main_doc, header_body=None, footer_body=None):
         """
@@ -129,6 +121,7 @@ class PdfGenerator:
         html = HTML(
             string=self.main_html,
             base_url=self.base_url,
+            url_fetcher=local_url_fetcher,
         )
         main_doc = html.render(stylesheets=[CSS(string=content_print_layout)])
 
@@ -145,8 +138,37 @@ class PdfGenerator:
         box which is named `element`.
 
         Look at the notes of the class for more details on Weasyprint insides.
+        Returns None when there is no such box.
         """
         for box in boxes:
             if box.element_tag == element:
                 return box
-            return PdfGenerator.get_element(box.all_children(), element)
+            found = PdfGenerator.get_element(box.all_children(), element)
+            if found is not None:
+                return found
+        return None
+
+
+@lru_cache(maxsize=32)
+def _overlay(element, html_string, base_url, language):
+    """
+    Layout of a header or footer: see PdfGenerator._compute_overlay_element.
+    `language` is only part of the cache key: the active language can change what the html renders to.
+    """
+    html = HTML(
+        string=html_string,
+        base_url=base_url,
+        url_fetcher=local_url_fetcher,
+    )
+    element_doc = html.render(stylesheets=[CSS(string=PdfGenerator.OVERLAY_LAYOUT)])
+    element_page = element_doc.pages[0]
+    element_body = PdfGenerator.get_element(element_page._page_box.all_children(), 'body')
+    element_body = element_body.copy_with_children(element_body.all_children())
+    element_html = PdfGenerator.get_element(element_page._page_box.all_children(), element)
+
+    if element == 'header':
+        element_height = element_html.height
+    if element == 'footer':
+        element_height = element_page.height - element_html.position_y
+
+    return element_body, element_height
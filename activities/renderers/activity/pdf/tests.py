@@ -1,152 +1,68 @@
 # -*- coding: utf-8 -*-
-import os
-import re
+from unittest import TestCase, mock
 
-from unittest import TestCase
+from django.utils import translation
 
-from .renderer import markdown_pdfcommand
+from . import renderer
+from .renderer import PdfGenerator
 
 '''
 How to run:
-python -m unittest activities.pdf.tests
+python manage.py test activities.renderers.activity.pdf
 '''
 
-class PdfTest(TestCase):
-    def setUp(self):
-        import django; django.setup()
-
-    def test_emphasis(self):
-        text = '_italics_'
-        rules = [('paragraph','<em>italics</em>')]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-    def test_double_emphasis(self):
-        text = '**bold**'
-        rules = [('paragraph','<strong>bold</strong>')]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-    def test_strikethrough(self):
-        text = '~~strike~~'
-        rules = [('paragraph','<del>strike</del>')]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-    def test_misc_formatting(self):
-        text = '_italics_, **bold**, ~~strike~~'
-        rules = [('paragraph','<em>italics</em>, <strong>bold</strong>, <del>strike</del>')]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-    def test_links(self):
-        text = 'http://auto.link <auto@email> [link](http://link)'
-        rules = [('paragraph','<a href="http://auto.link">http://auto.link</a> <a href="mailto:auto@email">auto@email</a> <a href="http://link">link</a>')]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-    def test_header_1(self):
-        text = '#### Just Magnetism'
-        rules = [('header_4', 'Just Magnetism')]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-    def test_header_2(self):
-        text = '#### Magnetism _and_ more...'
-        rules = [('header_4', 'Magnetism <em>and</em> more...')]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-    def test_lists(self):
-        text = '''
-- 1
-  - 2
-  - 3
-- 4
-  - 5
-'''
-        rules = [('list_item_1', '1'), ('list_item_2', '2'), ('list_item_2', '3'), ('list_item_1', '4'), ('list_item_2', '5'), ]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-    def test_lists_spaced(self):
-        text = '''
-- 1
-
-- 4
-'''
-        rules = [('list_item_1', '1'), ('list_item_1', '4'), ]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-    def test_lists_spaced_2(self):
-        text = '''
-
-- 1
-
-    - 2
-    - 3
-'''
-        rules = [('list_item_1', '1'), ('list_item_2', '2'), ('list_item_2', '3'), ]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
 
-    def test_table(self):
-        text = '''
-col1 | col2
----|:---:
-**1** | 2 | ~~3~~
-'''
-        rules = [('table', [[('col1', {'header': True, 'align': None}), ('col2', {'header': True, 'align': 'center'})], [('<strong>1</strong>', {'header': False, 'align': None}), ('2', {'header': False, 'align': 'center'}), ('<del>3</del>', {'header': False, 'align': None})]])]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-#     def test_table_emptycell(self):
-#         text = '''
-#  | col2
-# ---|---
-# A | B
-# '''
-#         rules = [('table', [[(' ', {'header': True, 'align': None}), ('col2', {'header': True, 'align': None})], [('A', {'header': False, 'align': None}), ('B', {'header': False, 'align': None})]])]
-#         result = markdown_pdfcommand(text)
-#         self.assertEqual(rules, result)
-
-    def test_table_emptycell_nbsp_utf(self):
-        text = '''
- | col2
----|---
-A | B
-'''
-        rules = [('table', [[(' ', {'header': True, 'align': None}), ('col2', {'header': True, 'align': None})], [('A', {'header': False, 'align': None}), ('B', {'header': False, 'align': None})]])]
-        result = markdown_pdfcommand(text)
-        self.assertEqual(rules, result)
-
-#     def test_table_emptycell_nbsp_utf_weirdbug(self):
-#         text = '''
-# - 1
-#   - 2
-#
-#  | col2
-# ---|---
-# A | B
-# '''
-#         rules = [('list_item_1', '1'), ('list_item_2', '2'), ('table', [[(' ', {'header': True, 'align': None}), ('col2', {'header': True, 'align': None})], [('A', {'header': False, 'align': None}), ('B', {'header': False, 'align': None})]])]
-#         result = markdown_pdfcommand(text)
-#         self.assertEqual(rules, result)
+class Box:
+    'Stand-in for a weasyprint layout box'
 
+    def __init__(self, tag, children=(), height=0, position_y=0):
+        self.element_tag = tag
+        self.children = list(children)
+        self.height = height
+        self.position_y = position_y
 
-#     def test_table_emptycell_nbsp_entity(self):
-#         text = '''
-# &nbsp;| col2
-# ---|---
-# A | B
-# '''
-#         rules = [('table', [[(' ', {'header': True, 'align': None}), ('col2', {'header': True, 'align': None})], [('A', {'header': False, 'align': None}), ('B', {'header': False, 'align': None})]])]
-#         result = markdown_pdfcommand(text)
-#         self.assertEqual(rules, result)
+    def all_children(self):
+        return self.children
 
+    def copy_with_children(self, children):
+        return Box(self.element_tag, children, self.height, self.position_y)
 
 
+class GetElementTest(TestCase):
+    def test_searches_every_child(self):
+        """
+        Tests that the box search does not stop at the first child's subtree
+        """
+        footer = Box('footer')
+        boxes = [Box('html', [Box('div', [Box('p')]), Box('body', [Box('header'), footer])])]
+        self.assertIs(footer, PdfGenerator.get_element(boxes, 'footer'))
+        self.assertIsNone(PdfGenerator.get_element(boxes, 'table'))
 
 
+class OverlayCacheTest(TestCase):
+    def setUp(self):
+        renderer._overlay.cache_clear()
+        self.addCleanup(renderer._overlay.cache_clear)
+        page = mock.Mock(height=800)
+        page._page_box.all_children.return_value = [Box('html', [Box('body', [Box('header', height=40)])])]
+        html = mock.patch.object(renderer, 'HTML')
+        self.HTML = html.start()
+        self.addCleanup(html.stop)
+        self.HTML.return_value.render.return_value.pages = [page]
+        css = mock.patch.object(renderer, 'CSS')
+        css.start()
+        self.addCleanup(css.stop)
+
+    def test_layout_reused(self):
+        """
+        Tests that a header is laid out once per html and language
+        """
+        generator = PdfGenerator('<p>main</p>', header_html='<header>astroEDU</header>', base_url='/')
+        with translation.override('en'):
+            body, height = generator._compute_overlay_element('header')
+            self.assertEqual((body.element_tag, height), ('body', 40))
+            generator._compute_overlay_element('header')
+            self.assertEqual(1, self.HTML.call_count)
+        with translation.override('it'):
+            generator._compute_overlay_element('header')
+        self.assertEqual(2, self.HTML.call_count)
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+from martor.utils import markdownify
+from parler.models import TranslationDoesNotExist
+
+from activities.models import ACTIVITY_SECTIONS
+from activities.templatetags.relativise_img_src import _relativise
+
+
+def get_translation(activity):
+    'The translation an Activity displays in the current language, following the parler fallbacks'
+    for language_code in [activity.get_current_language()] + list(activity.get_fallback_languages()):
+        try:
+            return activity.get_translation(language_code)
+        except TranslationDoesNotExist:
+            continue
+    return None
+
+
+def section_cache_key(translation, section_code):
+    # modification_date changes on every save of the activity, so old entries are never read again
+    modified = translation.master.modification_date
+    return 'activity-section:%s:%s:%s' % (translation.pk, section_code, modified.timestamp() if modified else '')
+
+
+def render_section(translation, section_code):
+    'Markdown to HTML, with image sources relativised, like the safe_markdown|relativise_img_src filters'
+    return _relativise(markdownify(getattr(translation, section_code)), translation.master)
+
+
+def rendered_sections(translation):
+    '''
+    Returns (code, title, html) for every ACTIVITY_SECTIONS section of `translation`.
+    The markdown output comes from the cache when possible, with a single lookup for all sections.
+    Image sources are relativised on every call: storage URLs may be signed and expire long before
+    the cached markdown, the memo of relativise_img_src keeps them fresh.
+    '''
+    keys = {section_code: section_cache_key(translation, section_code) for section_code, section_title in ACTIVITY_SECTIONS}
+    cached = cache.get_many(keys.values())
+    missing = {}
+    result = []
+    for section_code, section_title in ACTIVITY_SECTIONS:
+        html = cached.get(keys[section_code])
+        if html is None:
+            html = missing[keys[section_code]] = markdownify(getattr(translation, section_code))
+        result.append((section_code, section_title, _relativise(html, translation.master)))
+    if missing:
+        cache.set_many(missing, settings.SECTION_CACHE_TIMEOUT)
+    return result
+
+
+def invalidate_sections(translation):
+    cache.delete_many([section_cache_key(translation, section_code) for section_code, section_title in ACTIVITY_SECTIONS])
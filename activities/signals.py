@@ -0,0 +1,160 @@
+from django.contrib.sites.models import Site
+from django.db import transaction
+from django.utils.timezone import now
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from institutions.models import Institution, Person
+from .models import Activity, ActivityTranslation, ActivitySummary, Attachment, AuthorInstitution, LanguageAttachment, \
+    LanguageAttachmentTranslation, MetadataOption, PublishingModel, invalidate_publishing_state
+from .facets import invalidate_facet_counts
+from .sections import invalidate_sections
+from .site import invalidate_site_base
+from .tasks import enqueue_pdf
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def publishing_changed(sender, raw=False, **kwargs):
+    # any publishing model: Activity, Collection, SmartPage, ActivitySummary
+    if not raw and issubclass(sender, PublishingModel):
+        transaction.on_commit(lambda: invalidate_publishing_state(sender))
+
+
+@receiver(post_save, sender=ActivityTranslation)
+@receiver(post_delete, sender=ActivityTranslation)
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+def touch_activity(sender, instance, raw=False, **kwargs):
+    # modification_date drives the page validators and the generated downloads: move it when the text or
+    # the attachments change on their own (update() sends no signal, so this does not loop)
+    activity_id = instance.master_id if sender is ActivityTranslation else instance.hostmodel_id
+    if not raw and activity_id:
+        Activity.objects.filter(pk=activity_id).update(modification_date=now())
+
+
+@receiver(post_save, sender=Activity)
+def queue_activity_pdfs(sender, instance, raw=False, **kwargs):
+    # metadata, authors and attachments end up in every translation's PDF
+    if raw or not instance.published:
+        return
+
+    def enqueue():
+        # read at commit: the admin saves the translations after the activity
+        for pk in ActivityTranslation.objects.filter(master_id=instance.pk).values_list('pk', flat=True):
+            enqueue_pdf(pk)
+    # a rolled back save must not leave a job for the worker
+    transaction.on_commit(enqueue)
+
+
+@receiver(post_save, sender=ActivityTranslation)
+def queue_translation_pdf(sender, instance, raw=False, **kwargs):
+    if raw or not instance.master_id or not instance.master.published:
+        return
+    transaction.on_commit(lambda: enqueue_pdf(instance.pk))
+
+
+@receiver(post_save, sender=ActivityTranslation)
+def translation_search_vector(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ActivityTranslation.update_search_vectors(ActivityTranslation.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=ActivityTranslation)
+def translation_sections(sender, instance, raw=False, **kwargs):
+    # touch_activity moved modification_date, so the old entries would only linger until they expire
+    if not raw and instance.master_id:
+        invalidate_sections(instance)
+
+
+def refresh_summaries(qs):
+    # the admin saves an activity's translations, relations and inlines after the activity itself:
+    # wait for the whole change to be committed
+    transaction.on_commit(lambda: ActivitySummary.refresh_activities(qs))
+    transaction.on_commit(invalidate_facet_counts)
+
+
+@receiver(post_save, sender=Activity)
+def activity_summaries(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_summaries(Activity.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=ActivityTranslation)
+@receiver(post_delete, sender=ActivityTranslation)
+def translation_summaries(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_summaries(Activity.objects.filter(pk=instance.master_id))
+
+
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+def attachment_summaries(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_summaries(Activity.objects.filter(pk=instance.hostmodel_id))
+
+
+@receiver(post_save, sender=LanguageAttachment)
+@receiver(post_delete, sender=LanguageAttachment)
+def language_attachment_summaries(sender, instance, raw=False, **kwargs):
+    # not on the cards, but on the activity page: moves the summary's modification_date for its validators
+    if not raw:
+        refresh_summaries(Activity.objects.filter(pk=instance.hostmodel_id))
+
+
+@receiver(post_save, sender=LanguageAttachmentTranslation)
+@receiver(post_delete, sender=LanguageAttachmentTranslation)
+def language_attachment_translation_summaries(sender, instance, raw=False, **kwargs):
+    if not raw and instance.master_id:
+        refresh_summaries(Activity.objects.filter(languageattachment=instance.master_id))
+
+
+@receiver(post_save, sender=AuthorInstitution)
+@receiver(post_delete, sender=AuthorInstitution)
+def author_summaries(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_summaries(Activity.objects.filter(pk=instance.activity_id))
+
+
+@receiver(m2m_changed, sender=Activity.age.through)
+@receiver(m2m_changed, sender=Activity.level.through)
+def metadata_summaries(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Activity):
+        refresh_summaries(Activity.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=Activity.skills.through)
+@receiver(m2m_changed, sender=Activity.learning.through)
+@receiver(m2m_changed, sender=Activity.astronomical_categories.through)
+def metadata_facets(sender, instance, action, **kwargs):
+    # not on the activity cards, but counted in the list filters and shown on the activity page
+    if action.startswith('post_'):
+        transaction.on_commit(invalidate_facet_counts)
+        if isinstance(instance, Activity):
+            refresh_summaries(Activity.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=MetadataOption)
+def option_summaries(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_summaries(Activity.objects.all())
+
+
+@receiver(post_save, sender=Person)
+def person_summaries(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_summaries(Activity.objects.filter(authors__author=instance).distinct())
+
+
+@receiver(post_save, sender=Institution)
+def institution_summaries(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_summaries(Activity.objects.filter(authors__institution=instance).distinct())
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def site_changed(sender, **kwargs):
+    # absolute URLs are built from the Site domain (activities.site)
+    invalidate_site_base()
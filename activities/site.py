@@ -0,0 +1,36 @@
+'''
+Canonical scheme and host of the site, for the absolute URLs of activities, PDFs, short links and sitemaps.
+The host is the domain of the current Site (falling back to settings.SITE_URL when the sites table is not
+there yet), the scheme the one of settings.SITE_URL. Both are resolved once per process and forgotten
+when a Site is saved or deleted, like Django's own Site cache.
+'''
+from urllib.parse import urljoin, urlparse
+
+from django.conf import settings
+from django.db import DatabaseError
+
+_base = None
+
+
+def site_base():
+    'scheme://host of the canonical site, without a trailing slash'
+    global _base
+    if _base is None:
+        from django.contrib.sites.models import Site
+        site_url = urlparse(settings.SITE_URL)
+        try:
+            domain = Site.objects.get_current().domain
+        except (Site.DoesNotExist, DatabaseError):
+            domain = site_url.netloc
+        _base = '%s://%s' % (site_url.scheme or 'https', domain)
+    return _base
+
+
+def absolute_url(url):
+    'url (a path, relative to the site root, or already absolute) on the canonical site'
+    return urljoin(site_base() + '/', url)
+
+
+def invalidate_site_base(**kwargs):
+    global _base
+    _base = None
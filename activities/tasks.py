@@ -0,0 +1,92 @@
+import time
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connections, transaction
+from django.utils.timezone import now
+
+from activities.models import ActivityTranslation, PdfJob
+
+
+def init_worker():
+    # forked workers inherit the parent's DB sockets; drop them so each process opens its own
+    connections.close_all()
+
+
+def write_pdf(pk, force=False):
+    """
+    Render and store the PDF of one ActivityTranslation, unless its inputs are unchanged since the last render.
+    Returns a (code, lang, status, seconds, message) row for the summary table; failures after the
+    translation is loaded are reported in the row instead of raised.
+    """
+    start = time.time()
+    version = ActivityTranslation.objects.select_related('master').get(pk=pk)
+    code, lang = version.master.code, version.language_code
+    try:
+        fingerprint = version.get_pdf_fingerprint()
+        if not force and not version.pdf_is_stale(fingerprint):
+            return (code, lang, 'unchanged', time.time() - start, version.pdf.name)
+        file_obj = version.generate_pdf()
+
+        filename = f'astroedu-{code}-{lang}.pdf'
+        old_name = version.pdf.name if version.pdf else None
+        # write the new file first, swap the reference in one transaction, then drop the old file:
+        # a failure at any point leaves the translation pointing at a complete PDF
+        version.pdf.save(filename, ContentFile(file_obj), save=False)
+        with transaction.atomic():
+            ActivityTranslation.objects.filter(pk=pk).update(pdf=version.pdf.name, pdf_fingerprint=fingerprint)
+        if old_name and old_name != version.pdf.name:
+            version.pdf.storage.delete(old_name)
+    except Exception as e:
+        return (code, lang, 'failed', time.time() - start, str(e))
+    return (code, lang, 'written', time.time() - start, version.pdf.name)
+
+
+def enqueue_pdf(translation_id):
+    'Ask for a PDF render; saves made while a job is pending or running collapse into that job'
+    timestamp = now()
+    # a running job keeps running, and is re-queued when it finishes because requested > started
+    if PdfJob.objects.filter(translation_id=translation_id, status=PdfJob.STATUS_RUNNING).update(requested=timestamp):
+        return
+    if PdfJob.objects.filter(translation_id=translation_id).update(status=PdfJob.STATUS_PENDING, requested=timestamp, error=''):
+        return
+    try:
+        with transaction.atomic():
+            PdfJob.objects.create(translation_id=translation_id, requested=timestamp)
+    except IntegrityError:
+        # created by a concurrent save in the meantime
+        pass
+
+
+def claim_pdf_job():
+    'Mark the oldest pending job as running and return (pk, started), or None when the queue is empty'
+    for pk in PdfJob.objects.filter(status=PdfJob.STATUS_PENDING).values_list('pk', flat=True)[:20]:
+        started = now()
+        if PdfJob.objects.filter(pk=pk, status=PdfJob.STATUS_PENDING).update(status=PdfJob.STATUS_RUNNING, started=started):
+            return pk, started
+    return None
+
+
+def requeue_stale_pdf_jobs(minutes):
+    'Put back in the queue the jobs left running for more than `minutes` by a worker that died'
+    stale = PdfJob.objects.filter(status=PdfJob.STATUS_RUNNING, started__lt=now() - timedelta(minutes=minutes))
+    return stale.update(status=PdfJob.STATUS_PENDING)
+
+
+def run_pdf_job(job_pk, started):
+    'Render the job claimed at `started`, then settle it, or put it back in the queue if it was requested again'
+    translation_id, code, lang, attempts = PdfJob.objects.values_list(
+        'translation_id', 'translation__master__code', 'translation__language_code', 'attempts').get(pk=job_pk)
+    try:
+        row = write_pdf(translation_id)
+    except Exception as e:
+        row = (code, lang, 'failed', 0, str(e))
+    # only settle the job if the translation was not saved again while rendering
+    unchanged = PdfJob.objects.filter(pk=job_pk, requested__lte=started)
+    if row[2] == 'failed':
+        done = unchanged.update(status=PdfJob.STATUS_FAILED, attempts=attempts + 1, error=row[4])
+    else:
+        done = unchanged.delete()[0]
+    if not done:
+        PdfJob.objects.filter(pk=job_pk).update(status=PdfJob.STATUS_PENDING)
+    return row
@@ -1,6 +1,12 @@
 import re
+import time
+import threading
+import weakref
+from collections import OrderedDict
+from functools import partial
 
 from django import template
+from django.utils.functional import empty
 from django.utils.safestring import mark_safe
 from django.conf import settings
 from easy_thumbnails.files import get_thumbnailer
@@ -9,23 +15,85 @@ from django.core.files.storage import default_storage
 
 register = template.Library()
 
-def _relativise(value, activity, constraint=None):
-    new_start = 0
-    result = ''
-    for m in re.finditer(r'src="(.*?)".*?>', value):
-        new_src = m.group(1)
-        # Only replace image src if URL not DIVIO cloud hosting
-        if not new_src.startswith('https://astroedu-'):
-            path = new_src.replace("http://astroedu.iau.org/",'').replace('media/','')
+# the src of img tags only; the rest of the tag is kept
+IMG_SRC = re.compile(r'(<img\b[^>]*?\ssrc=")(.*?)(")', re.IGNORECASE)
+PLACEHOLDER = "https://via.placeholder.com/200x200?text=No+Image"
+
+
+class UrlMemo:
+    '''
+    Bounded LRU of (path, constraint) -> URL for one storage backend.
+    Storages that sign their URLs (S3 with querystring_auth) get entries that expire
+    well before the signature does.
+    '''
+
+    def __init__(self, storage, max_items=2048):
+        self.storage = storage
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if getattr(storage, 'querystring_auth', False):
+            self.max_age = getattr(storage, 'querystring_expire', 3600) / 2
+        else:
+            self.max_age = None
+
+    def url(self, path, constraint=None):
+        key = (path, constraint)
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and (self.max_age is None or now - item[1] < self.max_age):
+                self._items.move_to_end(key)
+                return item[0]
+        url = self._resolve(path, constraint)
+        with self._lock:
+            self._items[key] = (url, now)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return url
+
+    def _resolve(self, path, constraint):
+        if constraint:
             try:
-                new_src = default_storage.url(path)
-            except:
-                new_src = "https://via.placeholder.com/200x200?text=No+Image"
-        result += value[new_start:m.start()] + '<img src="%s"/>' % new_src
-        new_start = m.end()
-    result += value[new_start:]
-    result = mark_safe(result)
-    return result
+                thumbnailer = get_thumbnailer(self.storage, relative_name=path)
+                return thumbnailer.get_thumbnail({'size': (int(constraint), 0)}).url
+            except Exception:
+                # not an image easy_thumbnails can read: fall back to the original file
+                pass
+        try:
+            return self.storage.url(path)
+        except Exception:
+            return PLACEHOLDER
+
+
+_memos = weakref.WeakKeyDictionary()
+_memos_lock = threading.Lock()
+
+
+def url_memo():
+    'The UrlMemo of the current default storage; a new one when the storage is swapped (e.g. in tests)'
+    if default_storage._wrapped is empty:
+        default_storage._setup()
+    storage = default_storage._wrapped
+    with _memos_lock:
+        memo = _memos.get(storage)
+        if memo is None:
+            memo = _memos[storage] = UrlMemo(storage)
+    return memo
+
+
+def _replace(memo, constraint, m):
+    new_src = m.group(2)
+    # Only replace image src if URL not DIVIO cloud hosting
+    if not new_src.startswith('https://astroedu-'):
+        path = new_src.replace("http://astroedu.iau.org/",'').replace('media/','')
+        new_src = memo.url(path, constraint)
+    return m.group(1) + new_src + m.group(3)
+
+
+def _relativise(value, activity, constraint=None):
+    return mark_safe(IMG_SRC.sub(partial(_replace, url_memo(), constraint), value))
 
 
 @register.filter
@@ -36,5 +104,5 @@ def relativise_img_src(value, activity):
 
 @register.filter
 def relativise_constrain_img_src(value, activity):
-    '''Run this filter through some HTML to prepend the local URL to attached images'''
+    '''Run this filter through some HTML to prepend the local URL to attached images, resized to 900px wide'''
     return _relativise(value, activity, constraint='900')
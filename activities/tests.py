@@ -1,7 +1,59 @@
-from django.test import TestCase
+import gzip
+import io
+import os
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sites.models import Site
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.http import Http404
+from django.test.client import RequestFactory
+from django.utils.timezone import now
+
+from activities.conditional import activity_etag, activity_last_modified
+from activities.models import Activity, ActivitySummary, Attachment, AuthorInstitution, invalidate_publishing_state, model_transition, released_as_of, ActivityTranslation, DownloadLock, GeneratedDownload, MetadataOption, PdfJob
+from activities.renderers.activity import archive
+from activities.sections import rendered_sections
+from activities.templatetags.relativise_img_src import relativise_constrain_img_src, relativise_img_src
+from activities.site import absolute_url, invalidate_site_base
+from activities.tasks import claim_pdf_job, enqueue_pdf, requeue_stale_pdf_jobs, run_pdf_job
+from activities.utils import RenderInProgress, bleach_clean, generate_one, get_fresh_download, get_generated_url, get_qualified_url
+from astroedu import sitemaps
+from astroedu.pagecache import purge
+from institutions.models import Institution, Person
+from search.backends.whoosh_backend import WhooshBackend
+from search.documents import FACET_GROUPS
+from search.fulltext import search_activities
+from search import typeahead
+
+
+class ActivityTestCase(TestCase):
+    'Starts from an empty cache: invalidations run on commit, which TestCase never reaches'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+def make_activity(code, title=None, languages=('en',), **kwargs):
+    time, _ = MetadataOption.objects.get_or_create(group='time', code='1h', defaults={'title': '1 hour'})
+    supervised, _ = MetadataOption.objects.get_or_create(group='supervised', code='yes', defaults={'title': 'Supervised'})
+    kwargs.setdefault('release_date', now() - timedelta(days=1))
+    activity = Activity.objects.create(code=code, time=time, supervised=supervised, **kwargs)
+    for language_code in languages:
+        ActivityTranslation.objects.create(master=activity, language_code=language_code, title=title or 'Activity %s' % code, teaser='Teaser',
+                                           theme='Theme', keywords='', goals='', objectives='', evaluation='',
+                                           background='', fulldesc='', conclusion='')
+    return activity
 
-from activities.utils import bleach_clean
 
 class BleachTest(TestCase):
     def test_white_listed(self):
@@ -44,3 +96,787 @@ class BleachTest(TestCase):
         for text, expected in texts:
             self.assertEqual(expected, bleach_clean(text))
 
+
+
+class PdfJobTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        self.activity = make_activity('2101', published=False)
+        self.translation = self.activity.translations.get()
+
+    def test_saves_collapse(self):
+        """
+        Tests that repeated saves leave one pending job for the translation
+        """
+        enqueue_pdf(self.translation.pk)
+        enqueue_pdf(self.translation.pk)
+        self.assertEqual(1, PdfJob.objects.filter(translation=self.translation, status=PdfJob.STATUS_PENDING).count())
+
+    def test_claim(self):
+        """
+        Tests that a claimed job is running and is not claimed twice
+        """
+        enqueue_pdf(self.translation.pk)
+        pk, started = claim_pdf_job()
+        job = PdfJob.objects.get(pk=pk)
+        self.assertEqual(PdfJob.STATUS_RUNNING, job.status)
+        self.assertEqual(started, job.started)
+        self.assertIsNone(claim_pdf_job())
+
+    def test_saved_while_running(self):
+        """
+        Tests that a save during the render puts the job back in the queue
+        """
+        enqueue_pdf(self.translation.pk)
+        pk, started = claim_pdf_job()
+        enqueue_pdf(self.translation.pk)
+        PdfJob.objects.filter(pk=pk).update(requested=started + timedelta(seconds=1))
+        with mock.patch('activities.tasks.write_pdf', return_value=('2101', 'en', 'written', 0, '')):
+            run_pdf_job(pk, started)
+        self.assertEqual(PdfJob.STATUS_PENDING, PdfJob.objects.get(pk=pk).status)
+
+    def test_written(self):
+        """
+        Tests that a finished render removes the job
+        """
+        enqueue_pdf(self.translation.pk)
+        pk, started = claim_pdf_job()
+        with mock.patch('activities.tasks.write_pdf', return_value=('2101', 'en', 'written', 0, '')):
+            run_pdf_job(pk, started)
+        self.assertFalse(PdfJob.objects.filter(pk=pk).exists())
+
+    def test_failed(self):
+        """
+        Tests that a failed render is recorded on the job
+        """
+        enqueue_pdf(self.translation.pk)
+        pk, started = claim_pdf_job()
+        with mock.patch('activities.tasks.write_pdf', side_effect=IOError('disk full')):
+            row = run_pdf_job(pk, started)
+        self.assertEqual(('2101', 'en', 'failed'), row[:3])
+        job = PdfJob.objects.get(pk=pk)
+        self.assertEqual((PdfJob.STATUS_FAILED, 1, 'disk full'), (job.status, job.attempts, job.error))
+
+    def test_stale_requeued(self):
+        """
+        Tests that the worker re-queues jobs left running by a dead process
+        """
+        enqueue_pdf(self.translation.pk)
+        pk, started = claim_pdf_job()
+        self.assertEqual(0, requeue_stale_pdf_jobs(60))
+        PdfJob.objects.filter(pk=pk).update(started=now() - timedelta(hours=2))
+        self.assertEqual(1, requeue_stale_pdf_jobs(60))
+        self.assertEqual(PdfJob.STATUS_PENDING, PdfJob.objects.get(pk=pk).status)
+
+
+class PdfEnqueueTest(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # commits also write the sitemaps (the default Site is created before every test), into a storage not configured here
+        cls.sitemaps_writer = mock.patch('astroedu.sitemaps.write_sitemaps')
+        cls.sitemaps_writer.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sitemaps_writer.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_enqueued_on_commit(self):
+        """
+        Tests that saving an activity queues the PDFs of its translations once committed
+        """
+        with transaction.atomic():
+            make_activity('2101', languages=('en', 'it'))
+            self.assertFalse(PdfJob.objects.exists())
+        self.assertEqual(2, PdfJob.objects.filter(status=PdfJob.STATUS_PENDING).count())
+
+    def test_rolled_back(self):
+        """
+        Tests that a rolled back save leaves no job behind
+        """
+        with mock.patch('activities.signals.enqueue_pdf') as enqueue:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    make_activity('2101')
+                    raise RuntimeError
+        enqueue.assert_not_called()
+
+
+def write_code(obj, path, site_url=None):
+    'Stand-in download renderer'
+    with open(path, 'w') as f:
+        f.write(obj.code)
+
+
+class DownloadTestMixin:
+    objdef = dict(settings.ACTIVITY_DOWNLOADS, renderers={'txt': 'activities.tests.write_code'})
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        storage = mock.patch('activities.utils.default_storage', FileSystemStorage(location=self.media.name, base_url='/media/'))
+        storage.start()
+        self.addCleanup(storage.stop)
+
+
+class DownloadRegistryTest(DownloadTestMixin, ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        make_activity('2101')
+        ActivitySummary.refresh_activities(Activity.objects.all())
+        self.activity = Activity.objects.language('en').get(code='2101')
+
+    def summary_modified(self):
+        return ActivitySummary.objects.get(code='2101', language_code='en').modification_date
+
+    def test_registered(self):
+        """
+        Tests that a rendered download is recorded with the summary version it was rendered from
+        """
+        name = generate_one(self.objdef, self.activity, 'txt')
+        entry = GeneratedDownload.objects.get(model=self.objdef['model'], code='2101', lang='en', format='txt')
+        self.assertEqual(name, entry.name)
+        self.assertEqual(self.summary_modified(), entry.source_modified)
+        self.assertEqual(4, entry.size)
+
+    def test_fresh_not_rendered_again(self):
+        """
+        Tests that the registry skips renders of an unchanged source, and only those
+        """
+        with mock.patch('activities.tests.write_code', side_effect=write_code) as renderer:
+            generate_one(self.objdef, self.activity, 'txt')
+            generate_one(self.objdef, self.activity, 'txt')
+            self.assertEqual(1, renderer.call_count)
+            # what the signals do after a related object (author, option, attachment) changed
+            ActivitySummary.refresh_activities(Activity.objects.all())
+            self.assertIsNone(get_fresh_download(self.objdef, 'txt', '2101', 'en'))
+            generate_one(self.objdef, self.activity, 'txt')
+            self.assertEqual(2, renderer.call_count)
+        self.assertEqual(1, GeneratedDownload.objects.count())
+        self.assertTrue(get_fresh_download(self.objdef, 'txt', '2101', 'en'))
+
+    def test_replaced(self):
+        """
+        Tests that a new version is stored under a new name before the registry points to it, and the old file removed after
+        """
+        storage = FileSystemStorage(location=self.media.name)
+        old = generate_one(self.objdef, self.activity, 'txt')
+        self.activity.teaser = 'Changed'
+
+        def write_teaser(obj, path, site_url=None):
+            self.assertTrue(storage.exists(old))
+            with open(path, 'w') as f:
+                f.write(obj.teaser)
+
+        with mock.patch('activities.tests.write_code', side_effect=write_teaser):
+            new = generate_one(self.objdef, self.activity, 'txt', force=True)
+        self.assertNotEqual(old, new)
+        self.assertTrue(new.endswith('/astroedu-2101-en.txt'))
+        self.assertEqual(new, GeneratedDownload.objects.get().name)
+        self.assertFalse(storage.exists(old))
+        with storage.open(new) as f:
+            self.assertEqual(b'Changed', f.read())
+
+    def test_same_content(self):
+        """
+        Tests that rendering unchanged content again keeps its file, without suffixed copies
+        """
+        name = generate_one(self.objdef, self.activity, 'txt')
+        self.assertEqual(name, generate_one(self.objdef, self.activity, 'txt', force=True))
+        storage = FileSystemStorage(location=self.media.name)
+        self.assertEqual(['astroedu-2101-en.txt'], storage.listdir(os.path.dirname(name))[1])
+        self.assertTrue(storage.exists(name))
+
+
+@override_settings(DOWNLOAD_RENDER_WAIT=0)
+class SingleFlightDownloadTest(DownloadTestMixin, ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        make_activity('2101')
+        ActivitySummary.refresh_activities(Activity.objects.all())
+        self.lock_key = '%s:2101:en:txt' % self.objdef['model']
+
+    def test_render_releases_lock(self):
+        """
+        Tests that a render on demand registers the download and releases its lock
+        """
+        self.assertRegex(get_generated_url(self.objdef, 'txt', '2101', 'en'), r'^/media/activities/download/\w{16}/astroedu-2101-en\.txt$')
+        self.assertFalse(DownloadLock.objects.exists())
+
+    def test_locked(self):
+        """
+        Tests that a request does not render what another process is rendering
+        """
+        DownloadLock.objects.create(key=self.lock_key)
+        with mock.patch('activities.tests.write_code') as renderer:
+            with self.assertRaises(RenderInProgress):
+                get_generated_url(self.objdef, 'txt', '2101', 'en')
+        renderer.assert_not_called()
+
+    def test_stale_lock(self):
+        """
+        Tests that a lock left by a dead worker does not block renders
+        """
+        DownloadLock.objects.create(key=self.lock_key)
+        DownloadLock.objects.update(acquired=now() - timedelta(seconds=settings.DOWNLOAD_RENDER_TIMEOUT + 1))
+        self.assertTrue(get_generated_url(self.objdef, 'txt', '2101', 'en'))
+
+    def test_locked_view(self):
+        """
+        Tests that the activity page answers 202 while the download is rendered elsewhere
+        """
+        DownloadLock.objects.create(key='%s:2101:en:pdf' % self.objdef['model'])
+        response = self.client.get('/en/activities/2101/?format=pdf')
+        self.assertEqual(202, response.status_code)
+        self.assertEqual('5', response['Retry-After'])
+
+
+class ArchiveTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.storage = FileSystemStorage(location=self.media.name)
+        storage = mock.patch('activities.renderers.activity.archive.default_storage', self.storage)
+        storage.start()
+        self.addCleanup(storage.stop)
+        activity = make_activity('2101')
+        for name, content in (('activities/attach/2101/sheet.pdf', b'sheet'), ('activities/attach/2101/old/sheet.pdf', b'old sheet')):
+            Attachment.objects.create(hostmodel=activity, file=self.storage.save(name, ContentFile(content)), show=True)
+        Attachment.objects.create(hostmodel=activity, file='activities/attach/2101/hidden.pdf', show=False)
+        self.activity = Activity.objects.language('en').get(code='2101')
+
+    def test_zip(self):
+        """
+        Tests that the archive holds every shown attachment once, with flattened names
+        """
+        files = archive.attachment_files(self.activity)
+        with zipfile.ZipFile(io.BytesIO(b''.join(archive.iter_zip(files)))) as result:
+            self.assertEqual(['sheet.pdf', 'sheet-1.pdf'], result.namelist())
+            self.assertEqual(b'sheet', result.read('sheet.pdf'))
+            self.assertEqual(b'old sheet', result.read('sheet-1.pdf'))
+
+    def test_replaced_file(self):
+        """
+        Tests that replacing an attachment under the same name changes the name of the cached archive
+        """
+        files = archive.attachment_files(self.activity)
+        name = archive.archive_name(self.activity, files)
+        self.assertEqual(name, archive.archive_name(self.activity, files))
+        self.storage.delete('activities/attach/2101/sheet.pdf')
+        self.storage.save('activities/attach/2101/sheet.pdf', ContentFile(b'new sheet'))
+        self.assertNotEqual(name, archive.archive_name(self.activity, files))
+
+
+class ActivityListViewTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        make_activity('2101', title='Moon phases')
+        make_activity('2102', title='Hidden draft', published=False)
+        # the summaries are refreshed on commit, which TestCase never reaches
+        ActivitySummary.refresh_activities(Activity.objects.all())
+
+    def test_list(self):
+        """
+        Tests that the activity list shows the released activities
+        """
+        response = self.client.get('/en/activities/')
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, 'Moon phases')
+        self.assertNotContains(response, 'Hidden draft')
+
+    def test_category(self):
+        """
+        Tests that the category list renders
+        """
+        response = self.client.get('/en/activities/category/all/')
+        self.assertContains(response, 'Moon phases')
+
+
+class RenderedSectionsTest(ActivityTestCase):
+    def test_urls_resolved_on_every_call(self):
+        """
+        Tests that the markdown is rendered once, and image sources are resolved on every call
+        """
+        translation = make_activity('2101').translations.get()
+        with mock.patch('activities.sections.markdownify', return_value='<p><img src="a.png"></p>') as markdownify, \
+                mock.patch('activities.sections._relativise', side_effect=lambda html, activity: html) as relativise:
+            first = rendered_sections(translation)
+            second = rendered_sections(translation)
+        self.assertEqual(first, second)
+        self.assertEqual(len(first), markdownify.call_count)
+        self.assertEqual(2 * len(first), relativise.call_count)
+
+
+class RelativiseImgSrcTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.storage = FileSystemStorage(location=self.media.name, base_url='/media/')
+        storage = mock.patch.object(default_storage, '_wrapped', self.storage)
+        storage.start()
+        self.addCleanup(storage.stop)
+
+    def test_rewritten(self):
+        """
+        Tests that img tags get their src from the storage, keeping their other attributes
+        """
+        html = '<p><img alt="Moon" src="http://astroedu.iau.org/media/activities/moon.jpg" width="10"></p><img src="/media/sun.png" />'
+        self.assertEqual('<p><img alt="Moon" src="/media/activities/moon.jpg" width="10"></p><img src="/media/sun.png" />',
+                         relativise_img_src(html, None))
+
+    def test_other_tags_untouched(self):
+        """
+        Tests that only img tags are rewritten
+        """
+        html = '<iframe src="https://www.youtube.com/embed/x"></iframe>'
+        self.assertEqual(html, relativise_img_src(html, None))
+
+    def test_hosted_untouched(self):
+        """
+        Tests that images already on the hosted storage keep their URL
+        """
+        html = '<img src="https://astroedu-media.example.org/moon.jpg">'
+        self.assertEqual(html, relativise_img_src(html, None))
+
+    def test_memoized(self):
+        """
+        Tests that the storage URL of an image is resolved once
+        """
+        html = '<img src="/media/moon.jpg"><img src="/media/moon.jpg">'
+        with mock.patch.object(self.storage, 'url', wraps=self.storage.url) as url:
+            relativise_img_src(html, None)
+            relativise_img_src(html, None)
+        url.assert_called_once_with('/moon.jpg')
+
+    def test_constrained_fallback(self):
+        """
+        Tests that files easy_thumbnails cannot resize are linked as they are
+        """
+        self.storage.save('notes.txt', ContentFile(b'not an image'))
+        self.assertEqual('<img src="/media/notes.txt">', relativise_constrain_img_src('<img src="/media/notes.txt">', None))
+
+
+class FullTextSearchTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        make_activity('2101', title='Moon phases', languages=('en', 'it'))
+        make_activity('2102', title='Sunspots')
+        make_activity('2103', title='Hidden moon', published=False)
+        ActivitySummary.refresh_activities(Activity.objects.all())
+
+    def test_one_card_per_activity(self):
+        """
+        Tests that an activity matching in several languages is found once, in the requested language
+        """
+        result = list(search_activities('moon', 'en'))
+        self.assertEqual([('2101', 'en')], [(summary.code, summary.language_code) for summary in result])
+
+    def test_search_page(self):
+        """
+        Tests that the search page lists the released matches
+        """
+        response = self.client.get('/en/search/', {'q': 'moon'})
+        self.assertContains(response, 'Moon phases')
+        self.assertNotContains(response, 'Hidden moon')
+
+
+class TypeaheadTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        make_activity('2101', title='Phases of the Moon')
+        make_activity('2102', title='Moonlight')
+        make_activity('2103', title='Moon rising', published=False)
+        ActivityTranslation.objects.filter(master__code='2101').update(keywords='Moon, Lunar eclipse')
+        typeahead._indexes.clear()
+        self.addCleanup(typeahead._indexes.clear)
+
+    def labels(self, prefix, **kwargs):
+        return [result['label'] for result in typeahead.PrefixIndex.build('en').lookup(prefix, **kwargs)]
+
+    def test_word_prefixes(self):
+        """
+        Tests that titles match from the start of any word, ignoring case and accents, and only released activities;
+        results come in the order of the matched text, so exact matches first
+        """
+        self.assertEqual(['Moon', 'Phases of the Moon', 'Moonlight'], self.labels('moo'))
+        self.assertEqual(['Phases of the Moon'], self.labels('PHÀSES of'))
+        self.assertEqual(['Lunar eclipse'], self.labels('lun'))
+        self.assertEqual([], self.labels(' '))
+
+    def test_limit(self):
+        """
+        Tests that the lookup stops at the limit
+        """
+        self.assertEqual(['Moon'], self.labels('moo', limit=1))
+
+    def test_view(self):
+        """
+        Tests the JSON answer, with links to the activity or to a search for keywords
+        """
+        response = self.client.get('/en/search/typeahead/', {'q': 'lunar'})
+        self.assertEqual({'query': 'lunar', 'results': [{'label': 'Lunar eclipse', 'kind': 'keyword', 'url': '/en/search/?q=Lunar+eclipse'}]},
+                         response.json())
+        results = self.client.get('/en/search/typeahead/', {'q': 'phases'}).json()['results']
+        self.assertEqual([{'label': 'Phases of the Moon', 'kind': 'title', 'url': '/en/activities/2101/'}], results)
+
+    def test_invalidate(self):
+        """
+        Tests that the index of a language is kept until invalidated
+        """
+        index = typeahead.get_index('en')
+        self.assertIs(index, typeahead.get_index('en'))
+        typeahead.invalidate()
+        self.assertIsNot(index, typeahead.get_index('en'))
+
+
+class FacetedSearchTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.index_dir.cleanup)
+        backend = WhooshBackend(path=self.index_dir.name)
+        documents = []
+        for code, title in (('2101', 'Moon phases'), ('2102', 'Moon craters')):
+            make_activity(code, title=title)
+            document = {'key': code, 'fingerprint': '', 'title': title, 'keywords': '', 'text': title,
+                        'release_date': now() - timedelta(days=1), 'embargo_date': None}
+            document.update({group: [] for group in FACET_GROUPS}, level=['primary'])
+            documents.append(document)
+        backend.update('en', documents)
+        ActivitySummary.refresh_activities(Activity.objects.all())
+        patcher = mock.patch('search.views.get_backend', return_value=backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_search_page(self):
+        """
+        Tests that the faceted search lists the matches with their facet counts
+        """
+        response = self.client.get('/en/search/facets/', {'q': 'moon'})
+        self.assertEqual(['2101', '2102'], sorted(result.object.code for result in response.context['page']['object_list']))
+
+    def test_unpublished_before_reindex(self):
+        """
+        Tests that an activity unpublished since the last indexing is neither listed nor counted
+        """
+        Activity.objects.filter(code='2102').update(published=False)
+        ActivitySummary.refresh_activities(Activity.objects.all())
+        cache.clear()
+        with mock.patch('search.views._pimp_facets', side_effect=lambda facets: facets):
+            response = self.client.get('/en/search/facets/', {'q': 'moon'})
+        self.assertEqual(['2101'], [result.object.code for result in response.context['page']['object_list']])
+        self.assertEqual([('primary', 1)], response.context['facets']['fields']['level'])
+
+
+class MetadataTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.primary = MetadataOption.objects.create(group='level', code='primary', title='Primary', position=1)
+        self.secondary = MetadataOption.objects.create(group='level', code='secondary', title='Secondary', position=2)
+        self.young = MetadataOption.objects.create(group='age', code='6-8', title='6 - 8', position=1)
+        make_activity('2101').level.add(self.primary, self.secondary)
+        make_activity('2102').level.add(self.primary)
+        make_activity('2103').age.add(self.young)
+
+
+class FacetCountsTest(MetadataTestMixin, ActivityTestCase):
+    def test_counts(self):
+        """
+        Tests the number of activities per option, in a single query
+        """
+        with self.assertNumQueries(1):
+            counts = Activity.objects.all().facet_counts()
+        self.assertEqual({'primary': 2, 'secondary': 1}, counts['level'])
+        self.assertEqual({'6-8': 1}, counts['age'])
+        self.assertEqual({'1h': 3}, counts['time'])
+
+    def test_counts_of_filtered(self):
+        """
+        Tests that filtering on a group does not restrict the counts of its other options
+        """
+        counts = Activity.objects.filter(level=self.secondary).facet_counts()
+        self.assertEqual({'primary': 1, 'secondary': 1}, counts['level'])
+
+
+class MetadataFilterTest(MetadataTestMixin, ActivityTestCase):
+    def codes(self, selection):
+        return sorted(Activity.objects.filter_metadata(selection).values_list('code', flat=True))
+
+    def test_any_of_a_group(self):
+        """
+        Tests that several options of a group select activities having any of them, once
+        """
+        self.assertEqual(['2101', '2102'], self.codes({'level': ['primary', 'secondary']}))
+
+    def test_every_group(self):
+        """
+        Tests that different groups must all match
+        """
+        self.assertEqual([], self.codes({'level': ['primary'], 'age': ['6-8']}))
+        self.assertEqual(['2101', '2102'], self.codes({'level': ['primary'], 'time': ['1h']}))
+
+    def test_list_view(self):
+        """
+        Tests the metadata filters of the activity list, repeated or comma separated
+        """
+        ActivitySummary.refresh_activities(Activity.objects.all())
+        for query in ('level=secondary&level=unknown', 'level=secondary,unknown'):
+            response = self.client.get('/en/activities/?' + query)
+            self.assertEqual(['2101'], [summary.code for summary in response.context['object_list']])
+
+
+class PublishingTest(ActivityTestCase):
+    def codes(self, user=None):
+        return sorted(Activity.objects.available(user=user).values_list('code', flat=True))
+
+    def test_unpublish(self):
+        """
+        Tests that an activity leaves available() as soon as it is unpublished
+        """
+        activity = make_activity('2101')
+        self.assertEqual(['2101'], self.codes())
+        activity.published = False
+        activity.save()
+        self.assertEqual([], self.codes())
+
+    def test_release_and_embargo(self):
+        """
+        Tests that activities before their release date or under embargo are not available
+        """
+        make_activity('2101')
+        make_activity('2102', release_date=now() + timedelta(days=1))
+        make_activity('2103', embargo_date=now() + timedelta(days=1))
+        self.assertEqual(['2101'], self.codes())
+        with mock.patch('activities.models.publishing.now', return_value=now() + timedelta(days=2)):
+            self.assertEqual(['2101', '2102', '2103'], self.codes())
+
+    def test_transition(self):
+        """
+        Tests that the next transition is cached, and dropped on invalidation
+        """
+        release = now() + timedelta(days=1)
+        make_activity('2101', release_date=release)
+        self.assertEqual(release, model_transition(Activity))
+        sooner = now() + timedelta(hours=1)
+        make_activity('2102', release_date=sooner)
+        self.assertEqual(release, model_transition(Activity))
+        invalidate_publishing_state(Activity)
+        self.assertEqual(sooner, model_transition(Activity))
+
+    def test_stable_instant(self):
+        """
+        Tests that available() filters on the cached instant until the next transition, so its query does not change
+        """
+        make_activity('2101')
+        make_activity('2102', release_date=now() + timedelta(days=1))
+        query = str(Activity.objects.available().query)
+        with self.assertNumQueries(0):
+            released_as_of(Activity)
+        self.assertEqual(query, str(Activity.objects.available().query))
+        params = Activity.objects.embargoed().query.sql_with_params()[1]
+        # the same instant for the release and the embargo date
+        self.assertEqual(2, len(params))
+        self.assertEqual(1, len(set(params)))
+        with mock.patch('activities.models.publishing.now', return_value=now() + timedelta(days=2)):
+            self.assertNotEqual(query, str(Activity.objects.available().query))
+            self.assertEqual(['2101', '2102'], self.codes())
+
+    def test_invalidated_while_computing(self):
+        """
+        Tests that a value computed before an invalidation is not served after it
+        """
+        make_activity('2101', release_date=now() + timedelta(days=1))
+        sooner = now() + timedelta(hours=1)
+        real_set = cache.set
+
+        def saved_meanwhile(*args, **kwargs):
+            Activity.objects.filter(code='2101').update(release_date=sooner)
+            invalidate_publishing_state(Activity)
+            real_set(*args, **kwargs)
+
+        with mock.patch.object(cache, 'set', side_effect=saved_meanwhile):
+            model_transition(Activity)
+        self.assertEqual(sooner, model_transition(Activity))
+
+
+class ValidatorTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        self.activity = make_activity('2101')
+        institution = Institution.objects.create(name='ESO', slug='eso')
+        self.person = Person.objects.create(name='Jane Doe', email='jane@example.com', institution=institution)
+        AuthorInstitution.objects.create(activity=self.activity, author=self.person, institution=institution)
+        ActivitySummary.refresh_activities(Activity.objects.all())
+
+    def validators(self):
+        request = RequestFactory().get('/en/activities/2101/')
+        request.user = AnonymousUser()
+        return activity_etag(request, '2101'), activity_last_modified(request, '2101')
+
+    def test_related_change(self):
+        """
+        Tests that a change to an author, which only reaches the page through the summaries, moves the validators
+        """
+        etag, last_modified = self.validators()
+        self.assertEqual((etag, last_modified), self.validators())
+        self.person.name = 'Jane Roe'
+        self.person.save()
+        ActivitySummary.refresh_activities(Activity.objects.all())
+        new_etag, new_last_modified = self.validators()
+        self.assertNotEqual(etag, new_etag)
+        self.assertGreater(new_last_modified, last_modified)
+
+
+class PageCacheTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        make_activity('2101', title='Moon phases')
+        ActivitySummary.refresh_activities(Activity.objects.all())
+        self.client.get('/en/activities/')
+        ActivitySummary.objects.update(title='Moon and Sun')
+
+    def test_cached(self):
+        """
+        Tests that an anonymous page is served from the cache without queries
+        """
+        with self.assertNumQueries(0):
+            response = self.client.get('/en/activities/')
+        self.assertContains(response, 'Moon phases')
+
+    def test_purged(self):
+        """
+        Tests that purging a tag of the page renders it again
+        """
+        purge('activities')
+        self.assertContains(self.client.get('/en/activities/'), 'Moon and Sun')
+
+    def test_other_tag(self):
+        """
+        Tests that purging another tag keeps the page
+        """
+        purge('collections')
+        self.assertContains(self.client.get('/en/activities/'), 'Moon phases')
+
+    def test_session_bypass(self):
+        """
+        Tests that visitors with a session always get a fresh page
+        """
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'x'
+        self.assertContains(self.client.get('/en/activities/'), 'Moon and Sun')
+
+
+class SitemapTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = FileSystemStorage(location=tempfile.mkdtemp(), base_url='/media/')
+        patcher = mock.patch('astroedu.sitemaps.default_storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        make_activity('2101', languages=('en', 'it'))
+        make_activity('2102', release_date=now() + timedelta(days=1))
+
+    def test_index(self):
+        """
+        Tests that the index lists a file per language with the released activities
+        """
+        sitemaps.write_sitemaps()
+        response = self.client.get('/sitemap.xml')
+        self.assertContains(response, 'sitemaps/sitemap-en-1.xml.gz')
+        self.assertContains(response, 'sitemaps/sitemap-it-1.xml.gz')
+        urlset = gzip.decompress(self.client.get('/sitemaps/sitemap-en-1.xml.gz').content).decode()
+        self.assertIn('/en/activities/2101/', urlset)
+        self.assertIn('hreflang="it"', urlset)
+        self.assertNotIn('2102', urlset)
+
+    def test_not_modified(self):
+        """
+        Tests that the sitemaps answer conditional requests with the time of the build
+        """
+        sitemaps.write_sitemaps()
+        response = self.client.get('/sitemap.xml')
+        response = self.client.get('/sitemap.xml', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(304, response.status_code)
+
+    def test_builds(self):
+        """
+        Tests that a new build replaces the files only once it is complete, keeping the previous one
+        """
+        first = sitemaps.write_sitemaps()['build']
+        second = sitemaps.write_sitemaps()['build']
+        third = sitemaps.write_sitemaps()['build']
+        self.assertCountEqual([second, third], self.storage.listdir(sitemaps.SITEMAP_DIR)[0])
+        self.assertNotIn(first, self.storage.listdir(sitemaps.SITEMAP_DIR)[0])
+        self.assertCountEqual(['sitemap-en-1.xml.gz', 'sitemap-it-1.xml.gz', 'sitemap.xml'],
+                              self.storage.listdir(sitemaps._build_dir(third))[1])
+
+    def test_stored_state(self):
+        """
+        Tests that the files are still served when the cache lost the state, and never written by a request
+        """
+        build = sitemaps.write_sitemaps()['build']
+        cache.clear()
+        self.assertEqual(200, self.client.get('/sitemaps/sitemap-it-1.xml.gz').status_code)
+        self.assertEqual(build, sitemaps.current_state()['build'])
+        self.assertCountEqual([build], self.storage.listdir(sitemaps.SITEMAP_DIR)[0])
+
+    def test_nothing_built(self):
+        """
+        Tests that a request before the first build does not write the files
+        """
+        with self.assertRaises(Http404):
+            sitemaps.sitemap_index(RequestFactory().get('/sitemap.xml'))
+        self.assertFalse(self.storage.exists(sitemaps.SITEMAP_DIR))
+
+    def test_locked(self):
+        """
+        Tests that a writer skips while another one holds the lock, and leaves the sitemaps stale for it
+        """
+        cache.add(sitemaps.LOCK_KEY, True)
+        self.assertIsNone(sitemaps.write_sitemaps())
+        self.assertTrue(sitemaps.is_stale())
+        cache.delete(sitemaps.LOCK_KEY)
+        self.assertIsNotNone(sitemaps.write_sitemaps())
+        self.assertFalse(sitemaps.is_stale())
+
+
+@override_settings(SITE_URL='https://astroedu.iau.org')
+class SiteUrlTest(ActivityTestCase):
+    def setUp(self):
+        super().setUp()
+        Site.objects.clear_cache()
+        invalidate_site_base()
+        self.addCleanup(invalidate_site_base)
+        Site.objects.filter(pk=settings.SITE_ID).update(domain='astroedu.example.org')
+
+    def test_absolute_url(self):
+        """
+        Tests that absolute URLs take the host from the current Site and the scheme from SITE_URL
+        """
+        self.assertEqual('https://astroedu.example.org/en/activities/2101/', absolute_url('/en/activities/2101/'))
+        self.assertEqual('https://astroedu.example.org/media/a.pdf', get_qualified_url('/media/a.pdf'))
+        self.assertEqual('https://cdn.example.org/a.pdf', absolute_url('https://cdn.example.org/a.pdf'))
+
+    def test_resolved_once(self):
+        """
+        Tests that the site is only looked up once
+        """
+        absolute_url('/')
+        activity = make_activity('2101')
+        with self.assertNumQueries(0):
+            self.assertTrue(activity.get_absolute_url().startswith('https://astroedu.example.org/'))
+
+    def test_site_saved(self):
+        """
+        Tests that saving the Site changes the host of the next URLs
+        """
+        absolute_url('/')
+        site = Site.objects.get(pk=settings.SITE_ID)
+        site.domain = 'astroedu.example.com'
+        site.save()
+        self.assertEqual('https://astroedu.example.com/', absolute_url('/'))
@@ -1,21 +1,30 @@
 from django.urls import path
 from django.conf import settings
 
-from . import views
+from django.views.decorators.http import condition
+
+from astroedu.pagecache import page_cache
+from . import conditional, views
+from .models import Activity
+
+detail_cache = page_cache('activity:{code:0>4}', 'metadata')
+detail_condition = condition(etag_func=conditional.activity_etag, last_modified_func=conditional.activity_last_modified)
+feed_condition = condition(etag_func=conditional.released_etag(Activity), last_modified_func=conditional.released_last_modified(Activity))
+list_cache = page_cache('activities', 'metadata')
 
 urlpatterns = [
-    path('', views.ActivityListView.as_view(), name='list'),
-    path('feed/', views.ActivityFeed(), name='feed'),
+    path('', list_cache(views.ActivityListView.as_view()), name='list'),
+    path('feed/', page_cache('activities')(feed_condition(views.ActivityFeed())), name='feed'),
     path('ads/', views.AdsActivityList.as_view(), name='ads'),
-    path('<int:code>/', views.ActivityDetailView.as_view(), name='detail-code'),
+    path('<int:code>/', detail_cache(detail_condition(views.ActivityDetailView.as_view())), name='detail-code'),
     path('<int:code>/print-preview/', views.ActivityDetailPrintView.as_view(), name='print-preview'),
 
     # for PDF generator I need first page separated from other pages
     path('<int:code>/first-page-print-preview/', views.ActivityDetailFirstPagePrintView.as_view(), name='print-preview-header'),
     path('<int:code>/content-print-preview/', views.ActivityDetailContentPrintView.as_view(), name='print-preview-content'),
 
-    path('<int:code>/<slug:name>/', views.ActivityDetailView.as_view(), name='detail'),
+    path('<int:code>/<slug:name>/', detail_cache(detail_condition(views.ActivityDetailView.as_view())), name='detail'),
     path('<slug:name>/', views.ActivitybySlug.as_view(), name='detail-slug'),  # old style astroEDU URL
     # needed ActivityListView.get_view_url, but really is spaceawe specific:
-    path('category/<str:category>/', views.ActivityListView.as_view(), name='list_by_category'),
+    path('category/<str:category>/', list_cache(views.ActivityListView.as_view()), name='list_by_category'),
     ]
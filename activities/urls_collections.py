@@ -1,8 +1,13 @@
 from django.conf.urls import url
 
-from activities import views
+from django.views.decorators.http import condition
+
+from activities import conditional, views
+from astroedu.pagecache import page_cache
+
+detail_condition = condition(etag_func=conditional.collection_etag, last_modified_func=conditional.collection_last_modified)
 
 urlpatterns = [
-    url(r'^$', views.CollectionListView.as_view(), name='list'),
-    url(r'^(?P<collection_slug>[a-zA-Z0-9-]+)/$', views.CollectionDetailView.as_view(), name='detail'),
+    url(r'^$', page_cache('collections')(views.CollectionListView.as_view()), name='list'),
+    url(r'^(?P<collection_slug>[a-zA-Z0-9-]+)/$', page_cache('collections', 'activities')(detail_condition(views.CollectionDetailView.as_view())), name='detail'),
 ]
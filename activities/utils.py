@@ -4,13 +4,23 @@ import re
 import urllib
 import logging
 import time
+import hashlib
+import tempfile
 import importlib
+from datetime import timedelta
 
 import bleach
 from django.utils.html import strip_tags
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.core.mail import EmailMultiAlternatives, send_mail, BadHeaderError
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils.timezone import now
+
+from activities.site import absolute_url
 
 # Get an instance of a logger
 logger = logging.getLogger('astroEDU')
@@ -22,28 +32,135 @@ def get_python_thing(fullname):
     return getattr(module, thing_name)
 
 
+def _download_key(objdef, file_type, code, lang=None):
+    return {'model': objdef['model'], 'code': code, 'lang': lang or '', 'format': file_type}
+
+
+def _stamps(objdef, lang=None):
+    """
+    Available rows whose modification_date a download must have been rendered from: those of
+    objdef['stamp'] in the download's language when set (a read model that moves with every related
+    object ending up in the file), else those of the source model itself.
+    """
+    if 'stamp' in objdef:
+        stamps = get_python_thing(objdef['stamp']).objects.available()
+        return stamps.filter(language_code=lang) if lang else stamps
+    return get_python_thing(objdef['model']).objects.available()
+
+
 def generate_one(objdef, obj, file_type, force=False, site_url=None):
+    """
+    Render one download of obj into the default storage, unless the registry says the stored
+    copy was rendered from the current version of obj. Returns the storage name.
+    """
+    from activities.models import GeneratedDownload
+
     ctx = {'slug': obj.slug, 'code': obj.code, 'ext': file_type}
     if hasattr(obj, 'language_code'):
         ctx['lang'] = obj.language_code
+    key = _download_key(objdef, file_type, obj.code, ctx.get('lang'))
+    # read before rendering: a change saved meanwhile moves it past what the file was rendered from
+    source_modified = _stamps(objdef, ctx.get('lang')).filter(code=obj.code).values_list('modification_date', flat=True).first()
+    entry = GeneratedDownload.objects.filter(**key).first()
+    if not force and entry and source_modified is not None and entry.source_modified == source_modified:
+        return entry.name
+
+    if not site_url:
+        site_url = settings.SITE_URL
     filename = objdef['filename_tpl'] % ctx
-    path = os.path.join(settings.MEDIA_ROOT, objdef['path'], filename)
-    if force or (not (os.path.exists(path) and os.path.getmtime(path) > time.mktime(obj.modification_date.timetuple()))):
-        if not site_url:
-            site_url = settings.SITE_URL
-        renderer = get_python_thing(objdef['renderers'][file_type])
+    renderer = get_python_thing(objdef['renderers'][file_type])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, filename)
         renderer(obj, path, site_url=site_url)
-    return filename
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        # a new name per content: the registered file stays in place until the entry points to the new one
+        name = os.path.join(objdef['path'], digest.hexdigest()[:16], filename)
+        if not default_storage.exists(name):
+            with open(path, 'rb') as f:
+                name = default_storage.save(name, File(f))
+        size = os.path.getsize(path)
+
+    GeneratedDownload.objects.update_or_create(defaults={
+        'source_modified': source_modified,
+        'name': name,
+        'size': size,
+        'hash': digest.hexdigest(),
+    }, **key)
+    if entry and entry.name != name:
+        default_storage.delete(entry.name)
+    return name
+
+
+class RenderInProgress(Exception):
+    'Another process is rendering the requested download'
+    pass
+
+
+def get_fresh_download(objdef, file_type, code, lang=None):
+    from activities.models import GeneratedDownload
+
+    # a fresh download is one rendered from the current stamp of an available object
+    source = _stamps(objdef, lang).filter(code=OuterRef('code'), modification_date=OuterRef('source_modified'))
+    return GeneratedDownload.objects.filter(**_download_key(objdef, file_type, code, lang)).filter(Exists(source)).first()
+
+
+def _acquire_render_lock(key):
+    from activities.models import DownloadLock
+
+    # a lock older than any sane render belongs to a worker that died
+    stale = now() - timedelta(seconds=settings.DOWNLOAD_RENDER_TIMEOUT)
+    DownloadLock.objects.filter(key=key, acquired__lt=stale).delete()
+    try:
+        with transaction.atomic():
+            DownloadLock.objects.create(key=key)
+        return True
+    except IntegrityError:
+        return False
+
+
+def _release_render_lock(key):
+    from activities.models import DownloadLock
+
+    DownloadLock.objects.filter(key=key).delete()
 
 
 def get_generated_url(objdef, file_type, code, lang=None):
-    model = get_python_thing(objdef['model'])
-    if lang:
-        obj = model.objects.available().language(lang).get(code=code)
-    else:
-        obj = model.objects.available().get(code=code)
-    filename = generate_one(objdef, obj, file_type)
-    return settings.MEDIA_URL + objdef['path'] + filename
+    """
+    URL of a fresh download, rendering it first on a miss. Only one process renders a given
+    download at a time: the others wait up to DOWNLOAD_RENDER_WAIT seconds for it, then raise
+    RenderInProgress.
+    """
+    entry = get_fresh_download(objdef, file_type, code, lang)
+    if entry:
+        return default_storage.url(entry.name)
+
+    lock_key = ':'.join(_download_key(objdef, file_type, code, lang).values())
+    deadline = time.time() + settings.DOWNLOAD_RENDER_WAIT
+    while not _acquire_render_lock(lock_key):
+        if time.time() > deadline:
+            raise RenderInProgress(lock_key)
+        time.sleep(0.5)
+        entry = get_fresh_download(objdef, file_type, code, lang)
+        if entry:
+            return default_storage.url(entry.name)
+
+    try:
+        # it may have been rendered between our miss and taking the lock
+        entry = get_fresh_download(objdef, file_type, code, lang)
+        if entry:
+            return default_storage.url(entry.name)
+        model = get_python_thing(objdef['model'])
+        if lang:
+            obj = model.objects.available().language(lang).get(code=code)
+        else:
+            obj = model.objects.available().get(code=code)
+        name = generate_one(objdef, obj, file_type)
+    finally:
+        _release_render_lock(lock_key)
+    return default_storage.url(name)
 
 def beautify_age_range(age_ranges):
     'Unifies a list of age ranges into a string. Input list must be sorted.'
@@ -145,6 +262,4 @@ def bleach_clean(text):
 
 
 def get_qualified_url(local_url):
-    # current_site = Site.objects.get_current()
-    current_site = 'astroedu.iau.org'
-    return 'http://%s%s' % (current_site, local_url)
+    return absolute_url(local_url)
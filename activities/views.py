@@ -7,7 +7,7 @@ from django.contrib.syndication.views import Feed
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
 from django.utils.translation import get_language
@@ -15,8 +15,11 @@ from django.utils.translation import ugettext_lazy as _
 from django.views.generic import ListView, DetailView
 from parler.views import ViewUrlMixin, TranslatableSlugMixin
 
-from .utils import get_generated_url
-from .models import Activity, Collection, ACTIVITY_SECTIONS, ACTIVITY_METADATA, MetadataOption
+from .utils import get_generated_url, RenderInProgress
+from .renderers.activity import archive
+from .facets import cached_facet_counts
+from .sections import get_translation, rendered_sections
+from .models import Activity, ActivitySummary, Collection, ACTIVITY_SECTIONS, ACTIVITY_METADATA, ACTIVITY_METADATA_GROUPS, MetadataOption, metadata_conditions
 
 from martor.utils import LazyEncoder
 
@@ -69,7 +72,7 @@ def markdown_uploader(request):
 
 def home(request):
     return render(request, 'home.html',
-                  {'featured': Activity.objects.featured().active_translations()[0:3],})
+                  {'featured': ActivitySummary.objects.featured().filter(language_code=get_language())[0:3],})
 
 
 @login_required
@@ -86,28 +89,38 @@ def _activity_queryset(request, only_translations=True):
     return qs
 
 
+def _summary_queryset(request):
+    'Activity cards in the current language: a single query on ActivitySummary'
+    return ActivitySummary.objects.available(user=request.user).filter(language_code=get_language()).order_by('-code')
+
+
 class ActivityListView(ViewUrlMixin, ListView):
+    # the queryset is ActivitySummary, which would look for activitysummary_list.html
+    template_name = 'activities/activity_list.html'
     page_template_name = 'activities/activity_list_page.html'
     view_url_name = 'activities:list'
     paginate_by = 10
     all_categories = 'all'
 
     def get_queryset(self):
-        qs = _activity_queryset(self.request)
-        # if category and level is selected, combine filters
-        kwargs = self.request.GET
+        qs = _summary_queryset(self.request)
+        # if category and metadata are selected, combine filters
         if self.kwargs.get('category', self.all_categories) != self.all_categories:
             category = self.kwargs['category']
-            qs = qs.filter(**{category: True})
-
-        if 'level' in kwargs:
-            level = kwargs['level']
-            # qs = qs.filter(level__code__in=[level])
-            qs = qs.filter(level__code=level)
-        if 'age' in kwargs:
-            age = kwargs['age']
-            qs = qs.filter(age__code=age)
-        return qs
+            qs = qs.filter(**{'activity__%s' % category: True})
+        return qs.filter(*metadata_conditions(self.get_metadata_selection(), prefix='activity'))
+
+    def get_metadata_selection(self):
+        '''
+        The metadata filters of the request, {group: [option codes]}, from any ACTIVITY_METADATA group:
+        ?level=a&level=b or ?level=a,b selects either; different groups must all match.
+        '''
+        selection = {}
+        for group in ACTIVITY_METADATA_GROUPS:
+            codes = [code for value in self.request.GET.getlist(group) for code in value.split(',') if code]
+            if codes:
+                selection[group] = sorted(set(codes))
+        return selection
 
     def get_view_url(self):
         if 'level' in self.kwargs:
@@ -122,10 +135,22 @@ class ActivityListView(ViewUrlMixin, ListView):
         else:
             return super().get_template_names()
 
+    def get_facet_counts(self):
+        filters = {
+            'language': get_language(),
+            'all': bool(ActivitySummary.PublishingMeta.permission_all(self.request.user)),
+            'category': self.kwargs.get('category', self.all_categories),
+            'metadata': self.get_metadata_selection(),
+        }
+        activities = Activity.objects.filter(pk__in=self.object_list.values('activity_id'))
+        return cached_facet_counts(activities, filters)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['levels'] = MetadataOption.objects.filter(group='level')
-        print(context)
+        context['facet_counts'] = self.get_facet_counts()
+        context['levels'] = list(MetadataOption.objects.filter(group='level'))
+        for option in context['levels']:
+            option.count = context['facet_counts']['level'].get(option.code, 0)
         context['sections_meta'] = ACTIVITY_METADATA
         context['page_template'] = self.page_template_name
         context['all_categories'] = self.all_categories
@@ -147,19 +172,46 @@ class ActivityDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         context['sections'] = ACTIVITY_SECTIONS
         context['sections_meta'] = ACTIVITY_METADATA
+        translation = get_translation(self.object)
+        context['rendered_sections'] = rendered_sections(translation) if translation else []
         return context
 
     def get(self, request, *args, **kwargs):
         fmt = request.GET.get('format')
+        if fmt == 'zip':
+            return _attachments_zip(request, kwargs[self.slug_url_kwarg])
         if hasattr(settings, 'ACTIVITY_DOWNLOADS') and fmt in settings.ACTIVITY_DOWNLOADS['renderers'].keys():
-            code = kwargs[self.slug_url_kwarg]
-            url = get_generated_url(settings.ACTIVITY_DOWNLOADS, fmt, code, lang=get_language())
+            # the URL converter hands over an int, the registry and the lock key use the code as stored
+            code = str(kwargs[self.slug_url_kwarg])
+            try:
+                url = get_generated_url(settings.ACTIVITY_DOWNLOADS, fmt, code, lang=get_language())
+            except RenderInProgress:
+                response = HttpResponse(_('This download is being prepared, please try again in a few seconds.'), content_type='text/plain', status=202)
+                response['Retry-After'] = '5'
+                return response
             if not url:
                 raise Http404
             return redirect(url)
         else:
             return super().get(request, args, kwargs)
 
+def _attachments_zip(request, code):
+    'All attachments in one archive: served from the cache, or streamed (and cached) on a miss'
+    try:
+        obj = _activity_queryset(request, only_translations=False).language(get_language()).get(code=code)
+    except Activity.DoesNotExist:
+        raise Http404("Activity does not exist")
+    files = archive.attachment_files(obj)
+    if not files:
+        raise Http404
+    name = archive.archive_name(obj, files)
+    if default_storage.exists(name):
+        return redirect(default_storage.url(name))
+    response = StreamingHttpResponse(archive.stream_and_cache(files, name), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="astroedu-%s-attachments.zip"' % obj.code
+    return response
+
+
 class ActivitybySlug(ActivityDetailView):
     slug_field = 'translations__slug'
     slug_url_kwarg = 'name'
@@ -225,6 +277,11 @@ class CollectionDetailView(TranslatableSlugMixin, DetailView):
     # slug_field = 'slug'
     slug_url_kwarg = 'collection_slug'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['activities'] = _summary_queryset(self.request).filter(activity__collections=self.object)
+        return context
+
 class AdsActivityList(ListView):
     model = Activity
     template_name = "activities/activity_list_ads.html"
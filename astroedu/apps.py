@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class AstroeduConfig(AppConfig):
+    name = 'astroedu'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from astroedu.sitemaps import is_stale, write_sitemaps
+
+
+class Command(BaseCommand):
+    help = 'Writes the static sitemap files and the sitemap index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-stale', action='store_true',
+                            help='Only write after a missed content change or a release/embargo end (for cron)')
+
+    def handle(self, *args, **options):
+        if options['if_stale'] and not is_stale():
+            self.stdout.write('Sitemaps are up to date')
+            return
+        state = write_sitemaps()
+        if state is None:
+            self.stdout.write('Sitemaps are being written by another process')
+        else:
+            self.stdout.write(f"{len(state['files'])} sitemap files written")
@@ -0,0 +1,102 @@
+'''
+Full-page cache for anonymous visitors, per URL and language.
+
+Views are wrapped with page_cache(*tags) in the URLconfs. Every tag has a version in the cache, and
+purge(tag) bumps it, so all the pages tagged with it become stale at once. The receivers below purge
+on content changes. Pages also expire at the next release or embargo end of any publishing model
+(activities.models.next_transition), so scheduled content goes live on time.
+Visitors with a session cookie (editors) always get a fresh page, and serving a cached
+page needs no database query.
+'''
+import hashlib
+import math
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from django.utils.timezone import now
+from django.utils.translation import get_language
+
+
+def _tag_key(tag):
+    return 'pagecache:tag:%s' % tag
+
+
+def _page_key(request):
+    url = '%s|%s|%s' % (request.get_host(), request.get_full_path(), get_language())
+    return 'pagecache:page:%s' % hashlib.md5(url.encode('utf-8')).hexdigest()
+
+
+def tag_versions(tags):
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, 1, None)
+            versions[key] = cache.get(key, 1)
+    return tuple(versions[key] for key in keys)
+
+
+def purge(*tags):
+    for tag in tags:
+        try:
+            cache.incr(_tag_key(tag))
+        except ValueError:
+            cache.set(_tag_key(tag), 1, None)
+
+
+def _cacheable_request(request):
+    return request.method in ('GET', 'HEAD') and settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def _cacheable_response(request, response):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    if 'private' in response.get('Cache-Control', '') or 'no-store' in response.get('Cache-Control', ''):
+        return False
+    # the CSRF and session middlewares would add a cookie on the way out
+    session = getattr(request, 'session', None)
+    return not request.META.get('CSRF_COOKIE_USED') and not (session is not None and session.modified)
+
+
+def _store(request, key, versions, response):
+    from activities.models import next_transition
+    if not _cacheable_response(request, response):
+        return
+    valid_until = next_transition()
+    timeout = settings.PAGE_CACHE_TIMEOUT
+    if valid_until is not None:
+        timeout = min(timeout, math.ceil((valid_until - now()).total_seconds()))
+    if timeout > 0:
+        cache.set(key, (versions, valid_until, response), timeout)
+
+
+def page_cache(*tags):
+    '''
+    Caches the view's anonymous responses, purged with any of the tags.
+    Tags are formatted with the URL kwargs: page_cache('activities', 'activity:{code}').
+    '''
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.PAGE_CACHE_TIMEOUT or not _cacheable_request(request):
+                return view(request, *args, **kwargs)
+            key = _page_key(request)
+            # read before rendering: a purge while rendering leaves the stored page stale, not the next one
+            versions = tag_versions([tag.format(**kwargs) for tag in tags])
+            entry = cache.get(key)
+            if entry is not None and entry[0] == versions and (entry[1] is None or entry[1] > now()):
+                response = entry[2]
+                # answer If-None-Match / If-Modified-Since from the stored validators
+                last_modified = parse_http_date_safe(response['Last-Modified']) if response.has_header('Last-Modified') else None
+                return get_conditional_response(request, etag=response.get('ETag'), last_modified=last_modified, response=response)
+            response = view(request, *args, **kwargs)
+            if getattr(response, 'is_rendered', True):
+                _store(request, key, versions, response)
+            else:
+                response.add_post_render_callback(lambda rendered: _store(request, key, versions, rendered))
+            return response
+        return wrapper
+    return decorator
@@ -40,6 +40,9 @@ DIVIO_DOMAIN_ALIASES = [
 
 ALLOWED_HOSTS = [DIVIO_DOMAIN] + DIVIO_DOMAIN_ALIASES
 
+# canonical public address, used to build absolute URLs and to recognise our own assets when rendering PDFs
+SITE_URL = os.environ.get('SITE_URL', 'https://astroedu.iau.org')
+
 
 # Application definition
 
@@ -53,6 +56,7 @@ INSTALLED_APPS = [
     'django.contrib.redirects',
     'django.contrib.sites',
     'django.contrib.sitemaps',
+    'django.contrib.postgres',
     'parler',
     'easy_thumbnails',
     'pagedown',
@@ -62,6 +66,7 @@ INSTALLED_APPS = [
     'institutions',
     'activities',
     'filemanager',
+    'search',
     'astroedu'
 ]
 
@@ -155,6 +160,24 @@ PARLER_LANGUAGES = {
     }
 }
 
+# Postgres text search configuration per language code, languages not listed use 'simple'
+SEARCH_CONFIGS = {
+    'en': 'english',
+    'it': 'italian',
+}
+SEARCH_PAGE_SIZE = 10
+# below this many full text hits the simple search adds trigram (typo tolerant) matches, at most SEARCH_FUZZY_CANDIDATES
+SEARCH_FUZZY_MIN_HITS = 3
+SEARCH_FUZZY_CANDIDATES = 30
+
+# faceted search (search.views.search), the index is brought up to date by the update_index command
+SEARCH_BACKEND = 'search.backends.whoosh_backend.WhooshBackend'
+SEARCH_INDEX_DIR = os.environ.get('SEARCH_INDEX_DIR', os.path.join(BASE_DIR, 'search_index'))
+
+# search box suggestions: number of results, and seconds after which the in-memory index is rebuilt anyway
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MAX_AGE = 60 * 10
+
 ADMIN_SITE_TITLE  = 'astroEDU admin'
 DEBUG_PROPAGATE_EXCEPTIONS = True
 
@@ -200,6 +223,43 @@ THUMBNAIL_ALIASES = {
         },
 }
 
+# downloads rendered on demand (?format=...) and by compile_activity; the rtf and epub renderers
+# in activities.renderers.activity need toolkits that are not installed
+ACTIVITY_DOWNLOADS = {
+    'model': 'activities.models.Activity',
+    # downloads are fresh while the summary of their language is unchanged: it moves with the translation,
+    # authors, metadata options and attachments, which all end up in the files
+    'stamp': 'activities.models.ActivitySummary',
+    'path': 'activities/download/',
+    'filename_tpl': 'astroedu-%(code)s-%(lang)s.%(ext)s',
+    'renderers': {
+        'pdf': 'activities.renderers.activity.pdf',
+    },
+}
+
+# on-demand downloads: seconds a request waits for another worker's render before answering 202,
+# and seconds after which a render lock is considered abandoned
+DOWNLOAD_RENDER_WAIT = 10
+DOWNLOAD_RENDER_TIMEOUT = 600
+
+# URLs per sitemap file (the protocol allows 50000), see astroedu.sitemaps
+SITEMAP_CHUNK_SIZE = 10000
+
+# longest time a page is cached for anonymous visitors (see astroedu.pagecache), 0 disables the cache
+PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 60 * 60))
+
+# longest time "nothing scheduled" is cached for a publishing model; otherwise its next release or
+# embargo end, and the instant available() filters on, are cached until that moment
+# (see activities.models.publishing._publishing_state)
+PUBLISHING_CACHE_TIMEOUT = 60 * 60 * 24
+
+# seconds the option counts of the activity list filters are cached (see activities.facets); they are also
+# dropped whenever an activity changes, the timeout covers activities reaching their release date
+FACET_CACHE_TIMEOUT = 60 * 10
+
+# seconds the markdown output of activity sections is kept in the cache (see activities.sections)
+SECTION_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
 BLEACH_ALLOWED_TAGS = ('sup', 'sub', 'br', )
 BLEACH_ALLOWED_ATTRIBUTES = {}
 BLEACH_ALLOWED_STYLES = {}
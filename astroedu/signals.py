@@ -0,0 +1,113 @@
+from django.contrib.sites.models import Site
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from activities.models import Activity, ActivityTranslation, Attachment, AuthorInstitution, Collection, CollectionTranslation, LanguageAttachment, \
+    LanguageAttachmentTranslation, MetadataOption
+from institutions.models import Institution, Person
+from smartpages.models import SmartPage, SmartPageTranslation
+from . import sitemaps
+from .pagecache import purge
+
+
+def purge_on_commit(*tags):
+    transaction.on_commit(lambda: purge(*tags))
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def activity_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        purge_on_commit('activities', 'activity:%s' % instance.code)
+        sitemaps.invalidate()
+
+
+@receiver(post_save, sender=ActivityTranslation)
+@receiver(post_delete, sender=ActivityTranslation)
+def translation_pages(sender, instance, raw=False, **kwargs):
+    if not raw and instance.master_id:
+        purge_on_commit('activities', 'activity:%s' % instance.master.code)
+        sitemaps.invalidate()
+
+
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+def attachment_pages(sender, instance, raw=False, **kwargs):
+    if not raw and instance.hostmodel_id:
+        purge_on_commit('activities', 'activity:%s' % instance.hostmodel.code)
+
+
+@receiver(post_save, sender=LanguageAttachment)
+@receiver(post_delete, sender=LanguageAttachment)
+def language_attachment_pages(sender, instance, raw=False, **kwargs):
+    if not raw and instance.hostmodel_id:
+        purge_on_commit('activity:%s' % instance.hostmodel.code)
+
+
+@receiver(post_save, sender=LanguageAttachmentTranslation)
+@receiver(post_delete, sender=LanguageAttachmentTranslation)
+def language_attachment_translation_pages(sender, instance, raw=False, **kwargs):
+    if not raw and instance.master_id:
+        purge_on_commit('activity:%s' % instance.master.hostmodel.code)
+
+
+def author_pages(activities):
+    # authors are on the activity cards and detail pages
+    codes = activities.values_list('code', flat=True).distinct()
+    purge_on_commit('activities', *['activity:%s' % code for code in codes])
+
+
+@receiver(post_save, sender=AuthorInstitution)
+@receiver(post_delete, sender=AuthorInstitution)
+def author_institution_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        author_pages(Activity.objects.filter(pk=instance.activity_id))
+
+
+@receiver(post_save, sender=Person)
+def person_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        author_pages(Activity.objects.filter(authors__author=instance))
+
+
+@receiver(post_save, sender=Institution)
+def institution_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        author_pages(Activity.objects.filter(authors__institution=instance))
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=CollectionTranslation)
+@receiver(post_delete, sender=CollectionTranslation)
+def collection_pages(sender, raw=False, **kwargs):
+    if not raw:
+        purge_on_commit('collections')
+        sitemaps.invalidate()
+
+
+@receiver(post_save, sender=SmartPage)
+@receiver(post_delete, sender=SmartPage)
+@receiver(post_save, sender=SmartPageTranslation)
+@receiver(post_delete, sender=SmartPageTranslation)
+def smartpage_pages(sender, raw=False, **kwargs):
+    if not raw:
+        purge_on_commit('smartpages')
+
+
+@receiver(post_save, sender=MetadataOption)
+@receiver(post_delete, sender=MetadataOption)
+def metadata_pages(sender, raw=False, **kwargs):
+    # option titles are on every activity card and detail page
+    if not raw:
+        purge_on_commit('activities', 'metadata')
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def site_pages(sender, raw=False, **kwargs):
+    # absolute activity URLs (citation, sitemaps) carry the Site domain
+    if not raw:
+        purge_on_commit('activities')
+        sitemaps.invalidate()
@@ -0,0 +1,223 @@
+'''
+Static sitemaps: gzip-compressed files per language, in chunks of settings.SITEMAP_CHUNK_SIZE URLs,
+with hreflang alternates to the other translations and a sitemap index, kept in the default storage.
+They are written again once a content change is committed (astroedu.signals), and by the build_sitemaps
+command, which cron runs with --if-stale to pick up scheduled releases and embargo ends. Requests only
+read the stored files, so crawling never queries the catalogue.
+
+Every build goes into a directory of its own and the state switches to it once it is complete, so a
+served file is never missing or half written, whatever the storage; older builds are then removed.
+'''
+import gzip
+import re
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils import translation
+from django.utils.timezone import now
+from django.views.decorators.http import condition
+
+from activities.models import Activity, ActivityTranslation, Collection, CollectionTranslation, next_transition
+from activities.site import absolute_url
+
+SITEMAP_DIR = 'sitemaps/'
+INDEX_NAME = 'sitemap.xml'
+STATE_KEY = 'sitemaps:state'
+STALE_KEY = 'sitemaps:stale'
+LOCK_KEY = 'sitemaps:lock'
+LOCK_TIMEOUT = 10 * 60
+BUILD_FORMAT = '%Y%m%dT%H%M%S%fZ'
+FILE_NAME = re.compile(r'^sitemap-[\w-]+-\d+\.xml\.gz$')
+
+
+def _url(language_code, viewname, **kwargs):
+    with translation.override(language_code):
+        return absolute_url(reverse(viewname, kwargs=kwargs))
+
+
+def entries():
+    '''
+    (language code, url, lastmod, priority, {language code: url of every translation}) of the released
+    activities and collections, grouped by object: two queries.
+    '''
+    languages = {code for code, name in settings.LANGUAGES}
+    activities = ActivityTranslation.objects.filter(master__in=Activity.objects.available(), language_code__in=languages)
+    activities = activities.order_by('master__code', 'language_code').values_list('master__code', 'master__modification_date', 'language_code')
+    for code, rows in groupby(activities, key=lambda row: row[0]):
+        rows = list(rows)
+        urls = {language_code: _url(language_code, 'activities:detail-code', code=int(code)) for _, _, language_code in rows}
+        for _, modified, language_code in rows:
+            yield language_code, urls[language_code], modified, '0.7', urls
+    collections = CollectionTranslation.objects.filter(master__in=Collection.objects.available(), language_code__in=languages)
+    collections = collections.order_by('master_id', 'language_code').values_list('master_id', 'master__modification_date', 'language_code', 'slug')
+    for pk, rows in groupby(collections, key=lambda row: row[0]):
+        rows = list(rows)
+        urls = {language_code: _url(language_code, 'collections:detail', collection_slug=slug) for _, _, language_code, slug in rows}
+        for _, modified, language_code, slug in rows:
+            yield language_code, urls[language_code], modified, '0.6', urls
+
+
+def _urlset(chunk):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:xhtml="http://www.w3.org/1999/xhtml">']
+    for language_code, url, modified, priority, alternates in chunk:
+        lines.append('<url><loc>%s</loc>' % escape(url))
+        if modified:
+            lines.append('<lastmod>%s</lastmod>' % modified.date().isoformat())
+        lines.append('<priority>%s</priority>' % priority)
+        if len(alternates) > 1:
+            for alternate_language, alternate_url in sorted(alternates.items()):
+                lines.append('<xhtml:link rel="alternate" hreflang=%s href=%s/>' % (quoteattr(alternate_language), quoteattr(alternate_url)))
+        lines.append('</url>')
+    lines.append('</urlset>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _sitemapindex(names, generated):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    for name in names:
+        url = absolute_url(reverse('sitemap-file', kwargs={'name': name}))
+        lines.append('<sitemap><loc>%s</loc><lastmod>%s</lastmod></sitemap>' % (escape(url), generated.isoformat()))
+    lines.append('</sitemapindex>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _build_dir(build):
+    return '%s%s/' % (SITEMAP_DIR, build)
+
+
+def _delete_build(build):
+    path = _build_dir(build)
+    for name in default_storage.listdir(path)[1]:
+        default_storage.delete(path + name)
+    # removes the empty directory on the file system storage, a no-op on object stores
+    default_storage.delete(path.rstrip('/'))
+
+
+def _build_time(build):
+    return datetime.strptime(build, BUILD_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def _builds():
+    'names of the stored builds, oldest first'
+    if not default_storage.exists(SITEMAP_DIR):
+        return []
+    return sorted(default_storage.listdir(SITEMAP_DIR)[0])
+
+
+def _write():
+    generated = now()
+    latest = _builds()[-1:]
+    if latest and generated <= _build_time(latest[0]):
+        # a coarse clock: builds must sort in order and never share a directory
+        generated = _build_time(latest[0]) + timedelta(microseconds=1)
+    build = generated.astimezone(timezone.utc).strftime(BUILD_FORMAT)
+    by_language = {}
+    for entry in entries():
+        by_language.setdefault(entry[0], []).append(entry)
+    names = []
+    size = settings.SITEMAP_CHUNK_SIZE
+    for language_code, items in sorted(by_language.items()):
+        for number, start in enumerate(range(0, len(items), size), 1):
+            name = 'sitemap-%s-%d.xml.gz' % (language_code, number)
+            default_storage.save(_build_dir(build) + name, ContentFile(gzip.compress(_urlset(items[start:start + size]))))
+            names.append(name)
+    # the index is written last: a build without one is incomplete
+    default_storage.save(_build_dir(build) + INDEX_NAME, ContentFile(_sitemapindex(names, generated)))
+    state = {'build': build, 'generated': generated, 'valid_until': next_transition(), 'files': names}
+    cache.set(STATE_KEY, state, None)
+    # keep the previous build for the requests that read the state just before the switch
+    for old in [old for old in _builds() if old < build][:-1]:
+        _delete_build(old)
+    return state
+
+
+def write_sitemaps():
+    '''
+    Writes all the sitemap files and the index as a new build and switches to it, returns the state.
+    Returns None when another process is writing: that one writes again after its build.
+    '''
+    if not cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        cache.set(STALE_KEY, True, None)
+        return None
+    try:
+        while True:
+            cache.delete(STALE_KEY)
+            state = _write()
+            if not cache.get(STALE_KEY):
+                return state
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def _stored_state():
+    'state of the latest complete build in the storage, when the cache lost it'
+    for build in reversed(_builds()):
+        files = default_storage.listdir(_build_dir(build))[1]
+        if INDEX_NAME in files:
+            generated = _build_time(build)
+            names = sorted(name for name in files if FILE_NAME.match(name))
+            return {'build': build, 'generated': generated, 'valid_until': None, 'files': names}
+    return None
+
+
+def current_state():
+    'state of the build being served, None before the first one'
+    state = cache.get(STATE_KEY)
+    if state is None:
+        state = _stored_state()
+        if state is not None:
+            cache.add(STATE_KEY, state, None)
+    return state
+
+
+def is_stale():
+    state = cache.get(STATE_KEY)
+    return (state is None or cache.get(STALE_KEY) is not None
+            or (state['valid_until'] is not None and state['valid_until'] <= now()))
+
+
+def _write_if_stale():
+    # an admin save sends several signals: the first callback writes
+    if cache.delete(STALE_KEY):
+        write_sitemaps()
+
+
+def invalidate():
+    'Content changed: write the files again once the change is committed'
+    cache.set(STALE_KEY, True, None)
+    transaction.on_commit(_write_if_stale)
+
+
+def _last_modified(request, *args, **kwargs):
+    state = current_state()
+    return state['generated'] if state is not None else None
+
+
+def _serve(name, content_type):
+    state = current_state()
+    if state is None or (name != INDEX_NAME and name not in state['files']):
+        raise Http404
+    with default_storage.open(_build_dir(state['build']) + name) as f:
+        return HttpResponse(f.read(), content_type=content_type)
+
+
+@condition(last_modified_func=_last_modified)
+def sitemap_index(request):
+    return _serve(INDEX_NAME, 'application/xml')
+
+
+@condition(last_modified_func=_last_modified)
+def sitemap_file(request, name):
+    if not FILE_NAME.match(name):
+        raise Http404
+    return _serve(name, 'application/gzip')
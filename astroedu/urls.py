@@ -6,28 +6,26 @@ from django.conf.urls import url
 
 from django.conf import settings
 from django.views.generic import TemplateView, RedirectView
-from smartpages.views import SmartPageView
+from django.views.decorators.http import condition
+from smartpages.views import SmartPageView, smartpage_etag, smartpage_last_modified
 from django.contrib import admin
-from django.contrib.sitemaps.views import sitemap
 from django.conf.urls.i18n import i18n_patterns
 
 
-from activities.models import Activity, Collection
-from search.views import simplesearch
+from search.views import search, simplesearch, typeahead
 from activities.views import home, about, CollectionListView, CollectionDetailView, markdown_uploader
+from .pagecache import page_cache
+from .sitemaps import sitemap_file, sitemap_index
 
 admin.site.enable_nav_sidebar = False
 
-sitemaps = {
-    'activities': Activity.sitemap(priority=0.7),
-    'collections': Collection.sitemap(priority=0.6),
-}
-
 urlpatterns = i18n_patterns(
     path('admin/', admin.site.urls),
 
-    path('', home, name='home'),
+    path('', page_cache('activities')(home), name='home'),
     path('search/', simplesearch, name='search'),
+    path('search/facets/', search, name='search-facets'),
+    path('search/typeahead/', typeahead, name='search-typeahead'),
     # path('^testing/', include('astroedu.testing.urls', namespace='testing')),
     path('activities/', include(('activities.urls','activities'), namespace='activities'),),
     # path('collections/<str:collection_slug>/', CollectionDetailView.as_view(), name='collectionsdetail'),
@@ -36,13 +34,15 @@ urlpatterns = i18n_patterns(
     path('admin/about/', about, name='about'),
     # path('admin/history/', include('djangoplicity.adminhistory.urls', namespace='adminhistory_site')),
 
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
     # url(r'^page/(?P<url>.*/)$', SmartPageView.as_view(), name='smartpage'),
-    url(r'^(?P<url>.*/)$', SmartPageView.as_view(), name='smartpage')
+    url(r'^(?P<url>.*/)$', page_cache('smartpages')(condition(etag_func=smartpage_etag, last_modified_func=smartpage_last_modified)(SmartPageView.as_view())), name='smartpage')
 
 )
 
 urlpatterns += [
+    # static files written by astroedu.sitemaps, one index for all languages
+    path('sitemap.xml', sitemap_index, name='sitemap'),
+    path('sitemaps/<str:name>', sitemap_file, name='sitemap-file'),
     path('martor/', include('martor.urls')),
     path('api/uploader/', markdown_uploader, name='markdown_uploader_page'),
 ]
@@ -0,0 +1,36 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class SearchBackend:
+    '''
+    Interface of the faceted activity search backends, selected with settings.SEARCH_BACKEND.
+
+    search() returns {'results': [(code, score), ...], 'total': int, 'facets': {'fields': {group: [(option code, count), ...]}}}
+    with the facet counts over all the matches, not only the requested page.
+    `keys` restricts the matches to these document keys (activity codes), the ones the user may see.
+    '''
+
+    def search(self, query_string, language_code, queryfacets=None, keys=None, page=1, page_size=10):
+        raise NotImplementedError
+
+    def indexed(self, language_code):
+        'Returns {document key: fingerprint} of what is in the index'
+        raise NotImplementedError
+
+    def update(self, language_code, documents):
+        'Adds or replaces documents, dicts made by search.documents.document()'
+        raise NotImplementedError
+
+    def remove(self, language_code, keys):
+        raise NotImplementedError
+
+    def clear(self, language_code):
+        raise NotImplementedError
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.SEARCH_BACKEND)()
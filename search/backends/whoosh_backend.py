@@ -0,0 +1,113 @@
+import os
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+from whoosh import index, sorting
+from whoosh.analysis import LanguageAnalyzer, StandardAnalyzer, StemmingAnalyzer
+from whoosh.fields import DATETIME, ID, KEYWORD, TEXT, Schema
+from whoosh.lang import has_stemmer
+from whoosh.qparser import MultifieldParser
+from whoosh.query import And, Or, Term
+
+from search.backends import SearchBackend
+from search.documents import FACET_GROUPS
+
+# a date before any release, stored for activities without embargo
+NO_EMBARGO = timezone.datetime(1970, 1, 1)
+
+
+def analyzer(language_code):
+    if language_code == 'en':
+        return StemmingAnalyzer()
+    if has_stemmer(language_code):
+        return LanguageAnalyzer(language_code)
+    return StandardAnalyzer(stoplist=None)
+
+
+def schema(language_code):
+    fields = {
+        'key': ID(unique=True, stored=True),
+        'fingerprint': ID(stored=True),
+        'title': TEXT(analyzer=analyzer(language_code), field_boost=3.0),
+        'keywords': KEYWORD(commas=True, lowercase=True, scorable=True, field_boost=2.0),
+        'text': TEXT(analyzer=analyzer(language_code)),
+        'release_date': DATETIME,
+        'embargo_date': DATETIME,
+    }
+    for group in FACET_GROUPS:
+        fields[group] = KEYWORD(commas=True)
+    return Schema(**fields)
+
+
+def naive(value):
+    if value is None:
+        return NO_EMBARGO
+    return timezone.make_naive(value, timezone.utc) if timezone.is_aware(value) else value
+
+
+class WhooshBackend(SearchBackend):
+    '''
+    On-disk Whoosh index, one per language (so each gets its own stemming) in settings.SEARCH_INDEX_DIR.
+    Facet counts come from the index itself: a search is a single pass over the matching documents.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path or settings.SEARCH_INDEX_DIR
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _index(self, language_code):
+        with self._lock:
+            ix = self._indexes.get(language_code)
+            if ix is None:
+                os.makedirs(self.path, exist_ok=True)
+                if index.exists_in(self.path, indexname=language_code):
+                    ix = index.open_dir(self.path, indexname=language_code)
+                else:
+                    ix = index.create_in(self.path, schema(language_code), indexname=language_code)
+                self._indexes[language_code] = ix
+            return ix
+
+    def search(self, query_string, language_code, queryfacets=None, keys=None, page=1, page_size=10):
+        ix = self._index(language_code)
+        query = MultifieldParser(['title', 'keywords', 'text'], ix.schema).parse(query_string)
+        filters = [Term(group, value) for group, value in (queryfacets or {}).items() if group in FACET_GROUPS and value]
+        if keys is not None:
+            # the index only changes with update_index: what may be shown is decided by the database
+            if not keys:
+                return {'results': [], 'total': 0, 'facets': {'fields': {group: [] for group in FACET_GROUPS}}}
+            filters.append(Or([Term('key', key) for key in keys]))
+        facets = {group: sorting.FieldFacet(group, allow_overlap=True, maptype=sorting.Count) for group in FACET_GROUPS}
+        with ix.searcher() as searcher:
+            # optimize=False: skipping low scoring blocks would leave documents out of the facet counts
+            hits = searcher.search(query, filter=And(filters) if filters else None, groupedby=facets,
+                                   limit=page * page_size, optimize=False)
+            results = [(hit['key'], hit.score) for hit in hits[(page - 1) * page_size:page * page_size]]
+            fields = {}
+            for group in FACET_GROUPS:
+                counts = hits.groups(group)
+                fields[group] = sorted(counts.items(), key=lambda item: -item[1])
+            return {'results': results, 'total': len(hits), 'facets': {'fields': fields}}
+
+    def indexed(self, language_code):
+        with self._index(language_code).searcher() as searcher:
+            return {fields['key']: fields['fingerprint'] for fields in searcher.all_stored_fields()}
+
+    def update(self, language_code, documents):
+        with self._index(language_code).writer() as writer:
+            for doc in documents:
+                doc = dict(doc, release_date=naive(doc['release_date']), embargo_date=naive(doc['embargo_date']))
+                for group in FACET_GROUPS:
+                    doc[group] = ','.join(doc[group])
+                writer.update_document(**doc)
+
+    def remove(self, language_code, keys):
+        with self._index(language_code).writer() as writer:
+            for key in keys:
+                writer.delete_by_term('key', key)
+
+    def clear(self, language_code):
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            self._indexes[language_code] = index.create_in(self.path, schema(language_code), indexname=language_code)
@@ -0,0 +1,49 @@
+import hashlib
+
+from django.template.loader import render_to_string
+
+from activities.models import Activity, ActivityTranslation, ACTIVITY_METADATA_GROUPS, ACTIVITY_METADATA_M2M, ACTIVITY_SEARCH_WEIGHTS
+
+FACET_GROUPS = ACTIVITY_METADATA_GROUPS
+
+
+def indexable_translations(language_code):
+    'Translations that belong in the search index: those of published activities'
+    qs = ActivityTranslation.objects.filter(language_code=language_code, master__published=True).select_related('master')
+    return Activity.add_prefetch_related(qs, prefix='master')
+
+
+def facet_codes(activity, group):
+    if group in ACTIVITY_METADATA_M2M:
+        return [option.code for option in getattr(activity, group).all()]
+    option = getattr(activity, group)
+    return [option.code] if option else []
+
+
+def document_fingerprint(translation):
+    'Hash of everything a document is built from, without rendering the markdown'
+    activity = translation.master
+    items = [activity.code, activity.release_date, activity.embargo_date, translation.theme]
+    items += [getattr(translation, field) for field, weight in ACTIVITY_SEARCH_WEIGHTS]
+    items += [','.join(facet_codes(activity, group)) for group in FACET_GROUPS]
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(str(item).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def document(translation, fingerprint=None):
+    activity = translation.master
+    result = {
+        'key': activity.code,
+        'fingerprint': fingerprint or document_fingerprint(translation),
+        'title': translation.title,
+        'keywords': translation.keywords,
+        'text': render_to_string('search/indexes/activities/activity_text.txt', {'object': translation}),
+        'release_date': activity.release_date,
+        'embargo_date': activity.embargo_date,
+    }
+    for group in FACET_GROUPS:
+        result[group] = facet_codes(activity, group)
+    return result
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+
+from activities.models import ActivitySummary, ActivityTranslation
+from .lookups import TrigramWordSimilarity
+
+
+def search_config(language_code):
+    return settings.SEARCH_CONFIGS.get(language_code, 'simple')
+
+
+def search_activities(query_string, language_code, user=None):
+    '''
+    ActivitySummary objects of the activities whose translation in language_code matches query_string,
+    best first (annotated with .rank).
+    On Postgres the match uses the stored, GIN indexed ActivityTranslation.search_vector;
+    other databases fall back to a case insensitive scan of title, teaser and keywords.
+    '''
+    qs = ActivitySummary.objects.available(user=user).filter(language_code=language_code)
+    # one correlated subquery on the translation in language_code: a summary matches (and is ranked) at most once
+    translation = ActivityTranslation.objects.filter(master=OuterRef('activity'), language_code=language_code)
+    if connection.vendor != 'postgresql':
+        words = Q()
+        for field in ('title', 'teaser', 'keywords'):
+            words |= Q(**{'%s__icontains' % field: query_string})
+        return qs.filter(Exists(translation.filter(words))).order_by('-release_date')
+    query = SearchQuery(query_string, config=search_config(language_code))
+    match = translation.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query))
+    qs = qs.annotate(rank=Subquery(match.values('rank')[:1])).filter(rank__isnull=False)
+    return qs.order_by('-rank', '-release_date')
+
+
+def fuzzy_search_activities(query_string, language_code, user=None, exclude=()):
+    '''
+    ActivitySummary objects whose title or keywords are trigram-similar to query_string (typos), best first,
+    with .rank set to the similarity. The trigram operators use the GIN trigram indexes and the candidates
+    are capped at settings.SEARCH_FUZZY_CANDIDATES, so this never scans the whole table. Postgres only.
+    '''
+    if connection.vendor != 'postgresql':
+        return []
+    candidates = ActivityTranslation.objects.filter(language_code=language_code).exclude(master__in=exclude)
+    candidates = candidates.filter(Q(title__trigram_similar=query_string) | Q(keywords__trigram_word_similar=query_string))
+    candidates = candidates.annotate(similarity=Greatest(TrigramSimilarity('title', query_string), TrigramWordSimilarity('keywords', query_string)))
+    similarity = dict(candidates.order_by('-similarity').values_list('master_id', 'similarity')[:settings.SEARCH_FUZZY_CANDIDATES])
+    result = list(ActivitySummary.objects.available(user=user).filter(language_code=language_code, activity__in=similarity.keys()))
+    for summary in result:
+        summary.rank = similarity[summary.activity_id]
+    return sorted(result, key=lambda summary: -summary.rank)
+
+
+def search(query_string, language_code, user=None):
+    '''
+    Full text matches, topped up with fuzzy matches when there are fewer than settings.SEARCH_FUZZY_MIN_HITS.
+    A queryset, or a list when the fuzzy stage ran.
+    '''
+    qs = search_activities(query_string, language_code, user=user)
+    hits = list(qs[:settings.SEARCH_FUZZY_MIN_HITS])
+    if len(hits) >= settings.SEARCH_FUZZY_MIN_HITS:
+        return qs
+    return hits + fuzzy_search_activities(query_string, language_code, user=user, exclude=[hit.activity_id for hit in hits])
@@ -0,0 +1,27 @@
+from django.db.models import CharField, FloatField, Func, TextField, Value
+from django.db.models.lookups import PostgresOperatorLookup
+
+
+class TrigramWordSimilar(PostgresOperatorLookup):
+    '''
+    field__trigram_word_similar=query: query is similar to some run of words of the field (pg_trgm's %>).
+    Better than trigram_similar for a short query against a long value, like the keywords list.
+    '''
+    lookup_name = 'trigram_word_similar'
+    postgres_operator = '%%>'
+
+
+class TrigramWordSimilarity(Func):
+    'Word similarity of the string to the expression, 0 to 1'
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+    def __init__(self, expression, string, **extra):
+        if not hasattr(string, 'resolve_expression'):
+            string = Value(string)
+        # word_similarity(query, field)
+        super().__init__(string, expression, **extra)
+
+
+CharField.register_lookup(TrigramWordSimilar)
+TextField.register_lookup(TrigramWordSimilar)
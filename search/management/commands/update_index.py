@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from search.backends import get_backend
+from search.documents import document, document_fingerprint, indexable_translations
+
+
+class Command(BaseCommand):
+    help = 'Brings the search index up to date: (re-)indexes changed activities and removes unpublished ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lang', help='Only update the index of this language')
+        parser.add_argument('--rebuild', action='store_true', help='Empty the index and index everything again')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        languages = [options['lang']] if options['lang'] else [code for code, name in settings.LANGUAGES]
+        for language_code in languages:
+            if options['rebuild']:
+                backend.clear(language_code)
+            indexed = backend.indexed(language_code)
+            documents = []
+            current = set()
+            for translation in indexable_translations(language_code):
+                key = translation.master.code
+                current.add(key)
+                fingerprint = document_fingerprint(translation)
+                if indexed.get(key) != fingerprint:
+                    documents.append(document(translation, fingerprint))
+            removed = set(indexed) - current
+            if documents:
+                backend.update(language_code, documents)
+            if removed:
+                backend.remove(language_code, removed)
+            self.stdout.write(f'{language_code}: {len(documents)} indexed, {len(removed)} removed, {len(current) - len(documents)} unchanged')
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from activities.models import Activity, ActivityTranslation
+from .typeahead import invalidate
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+@receiver(post_save, sender=ActivityTranslation)
+@receiver(post_delete, sender=ActivityTranslation)
+def typeahead_changed(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(invalidate)
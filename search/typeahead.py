@@ -0,0 +1,98 @@
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from activities.models import Activity, ActivityTranslation
+
+GENERATION_KEY = 'search-typeahead:generation'
+
+
+def normalize(text):
+    'Lower case, without accents, whitespace collapsed'
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ' '.join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+
+class PrefixIndex:
+    '''
+    Sorted array of (key, label, kind, url). A lookup is a binary search for the prefix followed by a
+    scan of the matching range. Titles are indexed from the start of every word, keywords as a whole.
+    '''
+
+    def __init__(self, entries):
+        entries = sorted(set(entries))
+        self.keys = [entry[0] for entry in entries]
+        self.entries = entries
+
+    @classmethod
+    def build(cls, language_code):
+        entries = []
+        translations = ActivityTranslation.objects.filter(language_code=language_code, master__in=Activity.objects.available())
+        for title, keywords, code in translations.values_list('title', 'keywords', 'master__code'):
+            url = reverse('activities:detail-code', kwargs={'code': code})
+            words = normalize(title).split(' ')
+            for i in range(len(words)):
+                entries.append((' '.join(words[i:]), title, 'title', url))
+            for keyword in keywords.split(','):
+                keyword = keyword.strip()
+                if keyword:
+                    entries.append((normalize(keyword), keyword, 'keyword', '%s?%s' % (reverse('search'), urlencode({'q': keyword}))))
+        return cls(entries)
+
+    def lookup(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        result = []
+        seen = set()
+        if not prefix:
+            return result
+        for i in range(bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[i].startswith(prefix):
+                break
+            key, label, kind, url = self.entries[i]
+            if (label, url) not in seen:
+                seen.add((label, url))
+                result.append({'label': label, 'kind': kind, 'url': url})
+                if len(result) >= limit:
+                    break
+        return result
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = 1
+        cache.add(GENERATION_KEY, generation, None)
+    return generation
+
+
+def get_index(language_code):
+    '''
+    The PrefixIndex of a language, built on first use. It is rebuilt after invalidate() (from any process
+    sharing the cache) and after settings.TYPEAHEAD_MAX_AGE seconds, for activities reaching their release date.
+    '''
+    generation = _generation()
+    item = _indexes.get(language_code)
+    if item is None or item[1] != generation or time.monotonic() - item[2] > settings.TYPEAHEAD_MAX_AGE:
+        with _lock:
+            item = _indexes.get(language_code)
+            if item is None or item[1] != generation or time.monotonic() - item[2] > settings.TYPEAHEAD_MAX_AGE:
+                item = (PrefixIndex.build(language_code), generation, time.monotonic())
+                _indexes[language_code] = item
+    return item[0]
+
+
+def invalidate():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
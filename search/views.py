@@ -1,10 +1,22 @@
 from operator import itemgetter
 
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import JsonResponse
 from django.shortcuts import render
-from django.contrib.postgres.search import SearchVector
+from django.utils.translation import get_language
 
-from activities.models import Activity, MetadataOption,ActivityTranslation
+from activities.models import Activity, ActivitySummary, MetadataOption
+from .backends import get_backend
 from .forms import SearchForm
+from . import fulltext
+from .typeahead import get_index
+
+
+class SearchResult:
+    def __init__(self, object, score):
+        self.object = object
+        self.score = score
 
 
 def _pimp_facets(facets):
@@ -21,7 +33,10 @@ def _pimp_facets(facets):
             for code, count in values:
                 # obj = MetadataOption.objects.get(code=code, group=facet)
                 # new_values.append((code, obj.title, count, obj.position))
-                opt = options[(code, facet)]
+                opt = options.get((code, facet))
+                if opt is None:
+                    # option deleted since the document was indexed
+                    continue
                 new_values.append((code, opt[1], count, opt[2]))
             # sort by the position field
             facets['fields'][facet] = sorted(new_values, key=itemgetter(3))
@@ -32,10 +47,11 @@ def simplesearch(request):
     form = SearchForm(request.GET)
     if form.is_valid():
         search_query = form.cleaned_data['q']
-        search_result = ActivityTranslation.objects.annotate(search=SearchVector('title','description', 'keywords')).filter(search=search_query)
+        search_result = fulltext.search(search_query, get_language(), user=request.user)
+        page = Paginator(search_result, settings.SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
         context = {
             'query': search_query,
-            'page': {'object_list': search_result},
+            'page': page,
             'request': request,
             'form': form,
         }
@@ -45,7 +61,7 @@ def simplesearch(request):
             'form': form,
         }
 
-    if 'page' not in context or not context['page']['object_list']:
+    if 'page' not in context or not context['page'].object_list:
         context['featured'] = Activity.objects.featured().active_translations()[0:3]
 
     return render(request, 'search/simplesearch.html', context)
@@ -54,11 +70,31 @@ def search(request):
     form = SearchForm(request.GET)
     if form.is_valid():
         search_query = form.cleaned_data['q']
-        search_result = whoosh_utils.search(search_query, request.LANGUAGE_CODE, queryfacets=form.cleaned_data)
+        try:
+            page_number = max(1, int(request.GET.get('page', 1)))
+        except ValueError:
+            page_number = 1
+        language = get_language()
+        page_size = settings.SEARCH_PAGE_SIZE
+        # the publishing rules come from the database, so matches and facet counts only cover what the user may see
+        available = ActivitySummary.objects.available(user=request.user).filter(language_code=language)
+        search_result = get_backend().search(search_query, language, queryfacets=form.cleaned_data,
+                                             keys=set(available.values_list('code', flat=True)),
+                                             page=page_number, page_size=page_size)
+        # the page's summaries in one query, in the order of the index
+        codes = [code for code, score in search_result['results']]
+        summaries = {s.code: s for s in available.filter(code__in=codes)}
+        results = [SearchResult(summaries[code], score) for code, score in search_result['results'] if code in summaries]
         context = {
             'query': search_query,
             'facets': _pimp_facets(search_result['facets']),
-            'page': {'object_list': search_result['results']},
+            'page': {
+                'object_list': results,
+                'has_previous': page_number > 1,
+                'has_next': page_number * page_size < search_result['total'],
+                'previous_page_number': page_number - 1,
+                'next_page_number': page_number + 1,
+            },
             'request': request,
             'form': form,
         }
@@ -72,3 +108,10 @@ def search(request):
         context['featured'] = Activity.objects.featured().active_translations()[0:3]
 
     return render(request, 'search/search.html', context)
+
+
+def typeahead(request):
+    'Activity titles and keywords starting with ?q=, as JSON, for the search box'
+    query = request.GET.get('q', '')
+    results = get_index(get_language()).lookup(query, limit=settings.TYPEAHEAD_LIMIT)
+    return JsonResponse({'query': query, 'results': results})
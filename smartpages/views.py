@@ -1,3 +1,7 @@
+import hashlib
+
+from django.db.models import Max
+from django.utils.translation import get_language
 from django.views.generic import DetailView
 from parler.views import TranslatableSlugMixin
 
@@ -22,3 +26,22 @@ class SmartPageView(TranslatableSlugMixin, DetailView):
             self.kwargs[self.slug_url_kwarg] = '/' + slug
         result = super().get_object(queryset)
         return result
+
+
+def _smartpage_modified(request, url):
+    if '_smartpage_modified' not in request.__dict__:
+        url = url if url.startswith('/') else '/' + url
+        request._smartpage_modified = SmartPage.objects.filter(translations__url=url).aggregate(modified=Max('modification_date'))['modified']
+    return request._smartpage_modified
+
+
+def smartpage_etag(request, url):
+    modified = _smartpage_modified(request, url)
+    if modified is None:
+        return None
+    viewer = 'editor' if request.user.is_authenticated else 'public'
+    return hashlib.sha1(('%s|%s|%s' % (modified, get_language(), viewer)).encode('utf-8')).hexdigest()
+
+
+def smartpage_last_modified(request, url):
+    return _smartpage_modified(request, url)